@@ -76,7 +76,7 @@ def q_population(pop_params):
     population = []
 
     for stud_skills in population_q_profiles:
-        params = pop_params["student"]
+        params = dict(pop_params["student"])
         params["knowledge_levels"] = stud_skills
 
         population.append(params)
@@ -15,23 +15,44 @@ import numpy as np
 import copy
 
 from ..knowledge import Knowledge
+from .. import functions as func
 
 
 class Exercise(object):
 
+    """\
+        The levels of the exercise are one array, the list of the KC names is
+        shared with the student. Knowledge objects are only built by the
+        knowledges property.
+    """
+
+    # __dict__ is only created for the attributes of add_attr without slot
+    __slots__ = ("_act", "_answer", "_levels", "_names", "_nbMax_try", "_nb_try", "_gamma", "__dict__")
+
     def __init__(self, act, knowledge_levels=None, knowledge_names=None,
                  answer=None, nbMax_try=1, params=None, *args, **kwargs):
         # act :
 
         self._act = act
         self._answer = answer
-        self._knowledges = [Knowledge(kn, kl) for (kn, kl) in zip(knowledge_names, knowledge_levels)]
+        self._levels = np.array(knowledge_levels)
+        self._names = knowledge_names
 
         self._nbMax_try = nbMax_try
-        params = np.array(params)
 
         self.add_attr(args, kwargs)
 
+    def __getstate__(self):
+        return func.slots_getstate(self)
+
+    def __setstate__(self, state):
+        # Exercises pickled with a list of Knowledge objects
+        if "_knowledges" in state:
+            knowledges = state.pop("_knowledges")
+            state["_names"] = [kc._name for kc in knowledges]
+            state["_levels"] = np.array([kc._level for kc in knowledges])
+        func.slots_setstate(self, state)
+
     @property
     def state(self):
         state = {}
@@ -52,9 +73,21 @@ class Exercise(object):
     def answer(self):
         return self._answer
 
+    @property
+    def knowledge_names(self):
+        return self._names
+
+    @property
+    def knowledge_levels(self):
+        return self._levels
+
     @property
     def knowledges(self):
-        return self._knowledges
+        return [Knowledge(kn, kl) for (kn, kl) in zip(self._names, self._levels)]
+
+    @property
+    def _knowledges(self):
+        return self.knowledges
 
     def __repr__(self):
         # print "act : %s" % self._act
@@ -70,15 +103,15 @@ class Exercise(object):
         if by_gamma:
             return [int(gamma > 0) for gamma in self._gamma]
         elif by_names:
-            return [kc._name for kc in self._knowledges if kc._level != 0]
+            return [name for name, level in zip(self._names, self._levels) if level != 0]
         else:
-            return [self._knowledges.index(kc) for kc in self._knowledges if kc._level != 0]
+            return [i for i, level in enumerate(self._levels) if level != 0]
 
     def get_knowledges_level(self):
-        return np.array([kc._level for kc in self._knowledges])
+        return self._levels.copy()
 
     def get_attr(self):
-        return {"act": self._act, "knowledge": self._knowledges, "answer": self._answer}
+        return {"act": self._act, "knowledge": self.knowledges, "answer": self._answer}
 
     def add_attr(self, *args, **kwargs):
         for key, val in kwargs.iteritems():
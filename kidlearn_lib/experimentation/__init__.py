@@ -1 +1,3 @@
-from .experimentation import *
\ No newline at end of file
+from .experimentation import *
+from .batch_simulation import *
+from .session_trace import *
\ No newline at end of file
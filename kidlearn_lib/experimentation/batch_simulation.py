@@ -0,0 +1,382 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        batch_simulation
+# Purpose:     Advance a whole population of working sessions step by step
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+from ..exercise import Exercise
+from .. import functions as func
+from ..student import KTstudent, KTPopulationArray, Qstudent, QPopulationArray
+from ..seq_manager import BatchedZpdesHssbg, BatchedPOMDP
+from .experimentation import SessionStep, WorkingSession
+from .session_trace import SessionTrace, TraceStepList
+
+#########################################################
+#########################################################
+# Batch protocol
+#
+# A student batch provides :
+#   KC_names, nb_students
+#   get_kc_lvl()               -> (N, K) array of KC levels
+#   answer(ex_lvls, acts)      -> (N,) array of answers (learning included)
+#
+# A sequence manager batch provides :
+#   main_act, nb_students
+#   sample()                   -> acts of the N students
+#   compute_act_lvl(acts)      -> (N, K) array of exercise levels
+#   update(acts, answers)
+#   get_act(acts, num_stud)    -> act dict of one student
+#
+# Array based implementations hold the state of all the students in numpy
+# arrays, the list versions below wrap the per student objects so that every
+# model can be simulated in batch mode.
+#
+# Both batches have a random_states attribute : None, the numbers are drawn
+# with func.rng(), or the random stream of each student. Each student then
+# draws in its stream the numbers of its session in the same order, so that
+# the batch simulation gives the trajectories of the sessions run one by one.
+
+#########################################################
+#########################################################
+# class StudentList
+
+
+class StudentList(object):
+
+    random_states = None
+
+    def __init__(self, students, KC=None):
+        self._students = students
+        self._KC = KC or students[0].KC_names
+
+    @property
+    def students(self):
+        return self._students
+
+    @property
+    def KC_names(self):
+        return self._KC
+
+    @property
+    def nb_students(self):
+        return len(self._students)
+
+    def get_kc_lvl(self):
+        return np.array([stud.get_kc_lvl() for stud in self._students], dtype=float)
+
+    def answer(self, ex_lvls, acts=None):
+        answers = np.zeros(len(self._students), dtype=np.int8)
+        for i, stud in enumerate(self._students):
+            act = acts[i] if acts is not None else {}
+            ex = Exercise(act, ex_lvls[i], self._KC)
+            with func.random_stream(stream(self.random_states, i)):
+                stud.answer(ex)
+            answers[i] = ex._answer
+        return answers
+
+# class StudentList
+#########################################################
+
+#########################################################
+#########################################################
+# class SeqManagerList
+
+
+class SeqManagerList(object):
+
+    random_states = None
+
+    def __init__(self, seq_managers):
+        self._seq_managers = seq_managers
+        self._main_act = seq_managers[0].main_act
+        self._nb_students = len(seq_managers)
+
+    @property
+    def seq_managers(self):
+        return self._seq_managers
+
+    @property
+    def main_act(self):
+        return self._main_act
+
+    @property
+    def nb_students(self):
+        return self._nb_students
+
+    def sample(self):
+        # Some sequence managers return their internal act lists, copy them
+        # to keep one act per step
+        acts = []
+        for i, seq_manager in enumerate(self._seq_managers):
+            with func.random_stream(stream(self.random_states, i)):
+                act = seq_manager.sample()
+            acts.append({key: list(val) for key, val in act.items()})
+        return acts
+
+    def compute_act_lvl(self, acts):
+        return np.array([sm.compute_act_lvl(act, "main") for sm, act in zip(self._seq_managers, acts)], dtype=float)
+
+    def update(self, acts, answers):
+        for i, (seq_manager, act, ans) in enumerate(zip(self._seq_managers, acts, answers)):
+            with func.random_stream(stream(self.random_states, i)):
+                seq_manager.update(act, ans)
+
+    def get_act(self, acts, num_stud):
+        return acts[num_stud]
+
+    def free_data(self):
+        self._seq_managers = None
+
+# class SeqManagerList
+#########################################################
+
+#########################################################
+#########################################################
+# class BatchSimulation
+
+
+class BatchSimulation(object):
+
+    """\
+        Simulation of N students with N sequence managers, all the students
+        are advanced of one exercise at each step_forward call. Trajectories
+        are stored in (nb_step, N, K) arrays.
+    """
+
+    def __init__(self, students, seq_managers, nb_ex=0, *args, **kwargs):
+        self._students = students
+        self._seq_managers = seq_managers
+        self._KC = students.KC_names
+        self._main_act = seq_managers.main_act
+        self.nb_students = students.nb_students
+
+        self._nb_step = 0
+        self._allocate(nb_ex + 1)
+        self._kc_lvl[0] = students.get_kc_lvl()
+        self._nb_step = 1
+
+    @property
+    def KC(self):
+        return self._KC
+
+    @property
+    def main_act(self):
+        return self._main_act
+
+    @property
+    def nb_step(self):
+        return self._nb_step
+
+    @property
+    def kc_lvl(self):
+        return self._kc_lvl[:self._nb_step]
+
+    @property
+    def ex_lvl(self):
+        return self._ex_lvl[:self._nb_step]
+
+    @property
+    def answers(self):
+        return self._answers[:self._nb_step]
+
+    def _allocate(self, size):
+        shape = (size, self.nb_students, len(self._KC))
+        kc_lvl = np.zeros(shape)
+        ex_lvl = np.zeros(shape)
+        answers = np.zeros(shape[:2], dtype=np.int8)
+        if self._nb_step > 0:
+            kc_lvl[:self._nb_step] = self._kc_lvl[:self._nb_step]
+            ex_lvl[:self._nb_step] = self._ex_lvl[:self._nb_step]
+            answers[:self._nb_step] = self._answers[:self._nb_step]
+        else:
+            self._acts = []
+        self._kc_lvl = kc_lvl
+        self._ex_lvl = ex_lvl
+        self._answers = answers
+
+    def run(self, nb_ex):
+        if self._nb_step + nb_ex > len(self._kc_lvl):
+            self._allocate(self._nb_step + nb_ex)
+        for i in range(nb_ex):
+            self.step_forward()
+
+    def step_forward(self):
+        if self._nb_step == len(self._kc_lvl):
+            self._allocate(2 * self._nb_step)
+        t = self._nb_step
+
+        acts = self._seq_managers.sample()
+        ex_lvls = self._seq_managers.compute_act_lvl(acts)
+        answers = self._students.answer(ex_lvls, acts)
+
+        self._acts.append(acts)
+        self._ex_lvl[t] = ex_lvls
+        self._answers[t] = answers
+        self._kc_lvl[t] = self._students.get_kc_lvl()
+        self._nb_step += 1
+
+        self._seq_managers.update(acts, answers)
+
+    def get_act(self, time, num_stud):
+        if time == 0:
+            return None
+        return self._seq_managers.get_act(self._acts[time - 1], num_stud)
+
+    def session_step(self, time, num_stud):
+        return SessionStep(trace=BatchStudentTrace(self, num_stud), time=time)
+
+    def free_data(self):
+        # Sequence manager batch is kept to read the acts
+        self._students = None
+        if hasattr(self._seq_managers, "free_data"):
+            self._seq_managers.free_data()
+
+    ###########################################################################
+    # Data Analysis tools
+
+    def calcul_cost(self, begin=1, time=None, gamma=0.99):
+        if time is None:
+            time = self._nb_step
+        discount = np.power(gamma, np.arange(begin, time))
+        return np.dot(discount, self._kc_lvl[begin:time].sum(axis=2))
+
+    # Data Analysis tools
+    ###########################################################################
+
+# class BatchSimulation
+#########################################################
+
+#########################################################
+#########################################################
+# class BatchStudentTrace
+
+
+class BatchStudentTrace(SessionTrace):
+
+    """\
+        SessionTrace read interface on one student of a BatchSimulation
+    """
+
+    record_level = "acts_answers"
+    gamma = None
+    stats = None
+
+    def __init__(self, simulation, num_stud):
+        self._simulation = simulation
+        self._num_stud = num_stud
+        self.student_id = num_stud
+
+    @property
+    def nb_step(self):
+        return self._simulation.nb_step
+
+    @property
+    def kc_lvl(self):
+        return self._simulation.kc_lvl[:, self._num_stud]
+
+    def has_exercise(self, time):
+        return time > 0
+
+    def get_kc_lvl(self, time):
+        return self._simulation.kc_lvl[time, self._num_stud]
+
+    def get_ex_lvl(self, time):
+        return self._simulation.ex_lvl[time, self._num_stud]
+
+    def get_answer(self, time):
+        return self._simulation.answers[time, self._num_stud]
+
+    def get_act(self, time):
+        return self._simulation.get_act(time, self._num_stud)
+
+    def seq_manager_state(self, time):
+        return {}
+
+    def record(self, *args, **kwargs):
+        raise TypeError("steps of a batch simulation are recorded by BatchSimulation.step_forward, "
+                        "use WorkingGroup.run(batched=True)")
+
+# class BatchStudentTrace
+#########################################################
+
+#########################################################
+#########################################################
+# class BatchSessionView
+
+
+class BatchSessionView(WorkingSession):
+
+    """\
+        WorkingSession interface on one student of a BatchSimulation, used to
+        keep the data analysis tools of WorkingGroup and Experiment
+    """
+
+    def __init__(self, simulation, num_stud, student=None, seq_manager=None, uuid=None):
+        self.params = None
+        self._simulation = simulation
+        self._num_stud = num_stud
+        self._student = student
+        self._seq_manager = seq_manager
+        self.uuid = uuid
+        self._KC = simulation.KC
+        self._main_act = simulation.main_act
+        self._trace = BatchStudentTrace(simulation, num_stud)
+        self._step = TraceStepList(self._trace)
+        self._current_ex = None
+
+    @property
+    def main_act(self):
+        return self._main_act
+
+    def run(self, nb_ex):
+        raise TypeError("students of a batch simulation run with their group, "
+                        "use WorkingGroup.run(batched=True)")
+
+    def step_forward(self):
+        raise TypeError("students of a batch simulation run with their group, "
+                        "use WorkingGroup.run(batched=True)")
+
+    def save_actual_step(self, ex=None):
+        return
+
+# class BatchSessionView
+#########################################################
+
+
+def batch_from_sessions(working_sessions):
+    students = [ws.student for ws in working_sessions]
+    if all(type(stud) is KTstudent for stud in students):
+        students = KTPopulationArray.from_students(students)
+    elif all(type(stud) is Qstudent for stud in students):
+        students = QPopulationArray.from_students(students)
+    else:
+        students = StudentList(students, working_sessions[0].KC)
+    seq_managers = [ws.seq_manager for ws in working_sessions]
+    if BatchedZpdesHssbg.is_batchable(seq_managers):
+        seq_managers = BatchedZpdesHssbg.from_seq_managers(seq_managers)
+    elif BatchedPOMDP.is_batchable(seq_managers):
+        seq_managers = BatchedPOMDP.from_seq_managers(seq_managers)
+    else:
+        seq_managers = SeqManagerList(seq_managers)
+
+    # Student i draws in the stream of session i, the sessions without seed
+    # draw with func.rng()
+    random_states = [ws.random_state for ws in working_sessions]
+    if all(random_state is not None for random_state in random_states):
+        students.random_states = random_states
+        seq_managers.random_states = random_states
+    return students, seq_managers
+
+
+def stream(random_states, num_stud):
+    if random_states is None:
+        return None
+    return random_states[num_stud]
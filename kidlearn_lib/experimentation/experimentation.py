@@ -18,13 +18,18 @@ import json
 import numpy as np
 import uuid
 import time
+import hashlib
+import itertools
+import multiprocessing
+import scipy.stats as sstats
 
 # from ..seq_manager import Sequence, ZpdesHssbg, RiaritHssbg, RandomSequence, POMDP
 from ..exercise import Exercise
-from ..student import Population
+from ..student import Population, UniformTable, stud_dict_gen
 from ..config import datafile
 from .. import config
 from .. import functions as func
+from .session_trace import SessionTrace, TraceStepList
 #import config.datafile as datafile
 
 #########################################################
@@ -36,31 +41,67 @@ class SessionStep(object):
 
     """\
         SessionStep Definition
+
+        Built from the student, sequence manager and exercise states, or as a
+        view on the step time of a SessionTrace.
     """
 
-    def __init__(self, student_state=None, seq_manager_state=None, exercise=None, *args, **kwargs):
-        if student_state is None:
-            student_state = {}
-        if seq_manager_state is None:
-            seq_manager_state = {}
+    def __init__(self, student_state=None, seq_manager_state=None, exercise=None, trace=None, time=None, *args, **kwargs):
+        self._trace = trace
+        self._time = time
 
-        self.student = student_state
-        self.seq_manager = seq_manager_state
-        if exercise is not None:
-            self.exercise = exercise.state
-        else:
-            self.exercise = exercise
+        if trace is None:
+            if student_state is None:
+                student_state = {}
+            if seq_manager_state is None:
+                seq_manager_state = {}
+
+            self._student = student_state
+            self._seq_manager = seq_manager_state
+            if exercise is not None:
+                self._exercise = exercise.state
+            else:
+                self._exercise = exercise
 
         for key, val in kwargs.iteritems():
             object.__setattr__(self, key, val)
 
+    def __setstate__(self, state):
+        # Steps pickled before the trace storage
+        for key in ["student", "seq_manager", "exercise"]:
+            if key in state:
+                state["_" + key] = state.pop(key)
+        state.setdefault("_trace", None)
+        state.setdefault("_time", None)
+        self.__dict__.update(state)
+
+    @property
+    def student(self):
+        if self._trace is not None:
+            return self._trace.student_state(self._time)
+        return self._student
+
+    @property
+    def seq_manager(self):
+        if self._trace is not None:
+            return self._trace.seq_manager_state(self._time)
+        return self._seq_manager
+
+    @property
+    def exercise(self):
+        if self._trace is not None:
+            return self._trace.exercise_state(self._time)
+        return self._exercise
+
     @property
     def act(self):
+        if self._trace is not None:
+            return self._trace.get_act(self._time)
         return self.exercise["act"]
 
     @property
     def answer(self):
-        return self.exercise["answer"]
+        return self.get_attr("exercise", "answer")
 
     def __repr__(self):
         return "act : {}, student skill: {}".format(self.exercise, self.student["knowledges"])
@@ -68,6 +109,8 @@ class SessionStep(object):
     ###########################################################################
     # Data Analysis tools
     def get_attr(self, attr, *arg, **kwargs):
+        if self._trace is not None:
+            return self._trace.get_attr(self._time, attr, *arg)
         data = getattr(self, attr)
         if len(arg) > 0:
             if isinstance(data, dict):
@@ -102,19 +145,29 @@ class SessionStep(object):
 
 class WorkingSession(object):
 
-    def __init__(self, params=None, params_file=None, directory="params_files", student=None, seq_manager=None, *args, **kwargs):
+    def __init__(self, params=None, params_file=None, directory="params_files", student=None, seq_manager=None, record=None, snapshot_every=None, seed=None, *args, **kwargs):
 
         if params is not None or params_file is not None:
             params = params or func.load_json(params_file, directory)
         self.params = params
-
-        self._student = student or config.student(self.params["student"])
+        if record is None:
+            record = (params or {}).get("record", "acts_answers")
+        if seed is None:
+            seed = (params or {}).get("seed")
+        self.set_seed(seed)
+
+        # The student and the sequence manager created here draw their
+        # initial state from the stream of the session
+        with func.random_stream(self.random_state):
+            self._student = student or config.student(self.params["student"])
+            self._seq_manager = seq_manager or config.seq_manager(self.params["seq_manager"])
         self.uuid = self._student.uuid
-        self._seq_manager = seq_manager or config.seq_manager(self.params["seq_manager"])
 
         self._KC = self._student.KC_names
 
-        self._step = []
+        # Steps are stored in columns, self._step gives SessionStep views
+        self._trace = SessionTrace(self._KC, snapshot_every=snapshot_every, record=record)
+        self._step = TraceStepList(self._trace)
         self._current_ex = None
         self.save_actual_step()
         #self.log = SessionLog
@@ -135,6 +188,10 @@ class WorkingSession(object):
     def seq_manager(self):
         return self._seq_manager
 
+    @property
+    def record_level(self):
+        return self._trace.record_level
+
     @property
     def main_act(self):
         return self._seq_manager.main_act
@@ -145,17 +202,24 @@ class WorkingSession(object):
 
     # methods
 
+    def set_seed(self, seed):
+        # The draws of the session come from its own RandomState, None uses
+        # the current stream (np.random)
+        self.random_state = None if seed is None else np.random.RandomState(seed)
+
     def run(self, nb_ex):
+        self._trace.reserve(self.nb_step + nb_ex)
         for i in range(nb_ex):
             self.step_forward()
         self.free_data()
 
     def step_forward(self):
-        ex = self.new_exercise()
-        self.student_answer(ex)
-        self.save_actual_step(ex)
-        #self.log.log(new_ex, student_answer)
-        self.update_manager(ex)
+        with func.random_stream(self.random_state):
+            ex = self.new_exercise()
+            self.student_answer(ex)
+            self.save_actual_step(ex)
+            #self.log.log(new_ex, student_answer)
+            self.update_manager(ex)
 
     def new_exercise(self):
         act = self._seq_manager.sample()
@@ -176,7 +240,8 @@ class WorkingSession(object):
         return SessionStep(copy.deepcopy(self._student.get_state()), copy.deepcopy(self._seq_manager.get_state()), copy.deepcopy(ex or self._current_ex))
 
     def save_actual_step(self, ex=None):
-        self._step.append(self.actual_step(ex))
+        # Only the data of the record level are copied
+        self._trace.record(self._student, self._seq_manager, ex or self._current_ex)
 
     def free_data(self):
         self._student = None
@@ -193,24 +258,51 @@ class WorkingSession(object):
     # Data Analysis tools
 
     def calcul_cost(self, begin=1, time=None, gamma=0.99):
+        # Discounted cost summed during the session
+        stats = self._trace.stats
+        if begin == 1 and time is None and stats is not None and gamma == stats.gamma:
+            return stats.cost
         if time is None:
             time = len(self._step)
-        return sum([pow(gamma, t) * sum(self.student_level_time(time=t, kc=range(len(self._KC)))) for t in range(begin, time)])
+        discount = np.power(gamma, np.arange(begin, time))
+        return np.dot(discount, self.kc_level_all_time()[begin:time].sum(axis=1, dtype=float))
 
     def time_max_level(self):
-        level_all_time = [sum(self.student_level_time(time=t, kc=range(len(self._KC)))) for t in range(len(self._step))]
+        if self._trace.stats is not None:
+            return self._trace.stats.time_max_level
+        level_all_time = self.kc_level_all_time().sum(axis=1, dtype=float)
         return np.argmax(level_all_time)
 
+    def current_level(self):
+        if self._trace.stats is not None:
+            return self._trace.stats.total_level
+        return self.kc_level_all_time()[-1].sum(dtype=float)
+
+    def first_mastery_time(self, kc=None):
+        # -1 for the KC not mastered
+        if self._trace.stats is not None:
+            first_mastery = self._trace.stats.first_mastery
+        else:
+            mastered = self.kc_level_all_time() >= 1
+            first_mastery = np.where(mastered.any(axis=0), mastered.argmax(axis=0), -1)
+        if kc is None:
+            return first_mastery
+        return first_mastery[kc]
+
+    def kc_level_all_time(self):
+        return self._trace.kc_lvl
+
     def student_level_time(self, time=0, kc=0):
+        knowledges = self.kc_level_all_time()[time]
         if isinstance(kc, list):
             # return [self._step[time].student["knowledges"][k].level for k in kc]
-            return self._step[time].student["knowledges"]
+            return knowledges
 
-        elif kc >= len(self._step[time].student["knowledges"]):
-            return np.mean(self._step[time].student["knowledges"])
+        elif kc >= len(knowledges):
+            return np.mean(knowledges)
             # return np.mean([self._step[time].student["knowledges"][k].level for k in range(len(self._step[time].student["knowledges"]))])
         else:
-            return self._step[time].student["knowledges"][kc]  # .level
+            return knowledges[kc]  # .level
 
     def get_act_obs(self, begin_time=1, end_time=None, act_key="KT6kc", **kwargs):
         act = []
@@ -246,8 +338,14 @@ class WorkingGroup(object):
         self.logs = {}
         self.uuid = str(uuid.uuid1())
 
+        # Session i draws from the stream func.session_seed(seed, i)
+        self.seed = params.get("seed")
+        self.paired = params.get("paired", False)
+
         if WorkingSessions:
             self._working_sessions = WorkingSessions
+            if self.seed is not None or self.paired:
+                self.set_seed(self.seed, self.paired)
 
         else:
             population = population or config.population(params=params["population"])
@@ -255,9 +353,15 @@ class WorkingGroup(object):
                 population = population.students
 
             self._working_sessions = []
-            for student_params in population:
+            for num_session, student_params in enumerate(population):
                 params = {"student": student_params, "seq_manager": self.params["seq_manager"]}
+                if "record" in self.params.keys():
+                    params["record"] = self.params["record"]
+                if self.seed is not None:
+                    params["seed"] = func.session_seed(self.seed, num_session)
                 self._working_sessions.append(WorkingSession(params=params))
+            if self.paired:
+                self.set_uniforms()
 
     @property
     def KC(self):
@@ -284,13 +388,51 @@ class WorkingGroup(object):
 
         return self._working_sessions[num_stud]
 
+    def set_seed(self, seed, paired=False):
+        self.seed = seed
+        self.paired = paired
+        for num_session, ws in enumerate(self._working_sessions):
+            ws.set_seed(None if seed is None else func.session_seed(seed, num_session))
+        if paired:
+            self.set_uniforms()
+
+    def set_uniforms(self):
+        # Paired mode : student i reads its learning and answer draws in the
+        # UniformTable of stream 1 of session i, the same in every group
+        if self.seed is None:
+            raise ValueError("paired simulations need a seed")
+        for num_session, ws in enumerate(self._working_sessions):
+            seed = func.session_seed(self.seed, num_session, 1)
+            ws.student.set_uniforms(UniformTable(seed, ws.student.nb_uniforms()))
+
     def step_forward(self):
         for ws in self._working_sessions:
             ws.step_forward()
 
-    def run(self, nb_ex):
-        for ws in self._working_sessions:
-            ws.run(nb_ex)
+    def run(self, nb_ex, batched=False):
+        if batched:
+            self.run_batch(nb_ex)
+        else:
+            for ws in self._working_sessions:
+                ws.run(nb_ex)
+
+    def run_batch(self, nb_ex):
+        # All the students are advanced together, sessions are replaced by
+        # views on the simulation arrays
+        from .batch_simulation import BatchSimulation, BatchSessionView, batch_from_sessions
+
+        # Student i draws in the stream of session i : same trajectories as
+        # the sessions run one by one (see run_xp/test_checks.py)
+        students, seq_managers = batch_from_sessions(self._working_sessions)
+        self.simulation = BatchSimulation(students, seq_managers, nb_ex)
+        self.simulation.run(nb_ex)
+        self.simulation.free_data()
+
+        self._working_sessions = [BatchSessionView(self.simulation, i, uuid=ws.uuid) for i, ws in enumerate(self._working_sessions)]
+
+    def set_working_sessions(self, working_sessions):
+        self._working_sessions = working_sessions
+        self.simulation = None
 
     def add_student(self, student, seq_manager):
         self._working_sessions.append(WorkingSession(student, seq_manager))
@@ -299,6 +441,8 @@ class WorkingGroup(object):
     # Data Analysis tools
 
     def calcul_cost(self):
+        if getattr(self, "simulation", None) is not None:
+            return list(self.simulation.calcul_cost())
         cost = []
         for ws in self._working_sessions:
             cost.append(ws.calcul_cost())
@@ -376,11 +520,19 @@ class Experiment(object):
             for key, val in kwargs.iteritems():
                 params[key] = val
 
-        self.uuid = str(uuid.uuid1())
-        self.date = time.strftime('%Y-%m-%d_%H-%M-%S')
         self.params = params
+        if "uuid" in self.params.keys():
+            self.uuid = self.params["uuid"]
+        else:
+            self.uuid = str(uuid.uuid1())
+        self.date = time.strftime('%Y-%m-%d_%H-%M-%S')
         self.logs = {}
 
+        # Paired mode is checked before the directories and the groups are
+        # created
+        if self.params.get("paired", False):
+            self.check_paired_models(WorkingGroups)
+
         self._seq_manager_list_name = self.params["seq_manager_list"]
         self.nb_step = self.params["nb_step"]
 
@@ -396,8 +548,28 @@ class Experiment(object):
         self.ref_expe = self.params["ref_expe"]
         self.do_simu_path(self.params["ref_expe"], path=self.params["path_to_save"])
 
+        # Paired mode : the students of the sessions i share the random
+        # numbers of their learning and answers (see UniformTable)
+        self.paired = self.params.get("paired", False)
+
+        # Seed of the session streams, the same for all the groups : the
+        # sequence managers are compared on the same random numbers. Without
+        # seed the sessions draw from np.random and the groups are independent
+        seeded = "seed" in self.params.keys()
+        if self.paired and not seeded:
+            self.params["seed"] = self.shard_seed()
+        self.seed = self.params.get("seed")
+
         if WorkingGroups is not None:
             self._groups = WorkingGroups
+            for group in self._groups.values():
+                for sub_group in group:
+                    # The seed given to a group is kept unless the experiment
+                    # has one
+                    if seeded or (self.seed is not None and sub_group.seed is None):
+                        sub_group.set_seed(self.seed, self.paired)
+                    elif self.paired:
+                        sub_group.set_seed(sub_group.seed, self.paired)
 
         else:
             self._groups = {key: [] for key in self._seq_manager_list_name}
@@ -406,13 +578,30 @@ class Experiment(object):
             for seq_manager_name in self._seq_manager_list_name:
                 params = self.params["WorkingGroup"]
                 params["seq_manager"] = self.params["seq_managers"][seq_manager_name]
+                if "record" in self.params.keys():
+                    params["record"] = self.params["record"]
                 params["population"] = self._population
+                if self.seed is not None:
+                    params["seed"] = self.seed
+                params["paired"] = self.paired
                 self.add_WorkingGroup(params)
 
         # self.population_simulation()
         #self.population = []
         # self.define_seq_manager()
 
+    def check_paired_models(self, WorkingGroups=None):
+        # Paired simulations need students reading their draws in a
+        # UniformTable (Student.paired_draws)
+        if WorkingGroups is not None:
+            models = [type(stud) for group in WorkingGroups.values() for sub_group in group for stud in sub_group.students]
+        else:
+            models = [stud_dict_gen[self.params["population"]["student"]["model"]]]
+        unsupported = sorted(set(model.__name__ for model in models if not getattr(model, "paired_draws", False)))
+        if unsupported:
+            raise ValueError("paired simulations need students drawing from a UniformTable, "
+                             "{} students draw their own random numbers".format(", ".join(unsupported)))
+
     @property
     def groups(self):
         return self._groups
@@ -465,16 +654,73 @@ class Experiment(object):
             for sub_group in group:
                 sub_group.step_forward()
 
-    def run(self, nb_ex=None):
+    def run(self, nb_ex=None, batched=False, n_jobs=1, nb_shards=None):
         nb_ex = nb_ex or self.nb_step
+        if n_jobs > 1:
+            self.run_parallel(nb_ex, batched, n_jobs, nb_shards)
+            return
         for name, group in self._groups.items():
             print name
-            self.launch_group_simulation(group, nb_ex)
+            self.launch_group_simulation(group, nb_ex, batched)
 
-    def launch_group_simulation(self, group, nb_ex=None):
+    def launch_group_simulation(self, group, nb_ex=None, batched=False):
         nb_ex = nb_ex or self.nb_step
         for sub_group in group:
-            sub_group.run(nb_ex)
+            sub_group.run(nb_ex, batched)
+
+    def run_parallel(self, nb_ex=None, batched=False, n_jobs=2, nb_shards=None):
+        # Each WorkingGroup is split in nb_shards groups of students run in
+        # a process pool. Sessions with a seed keep their own stream and give
+        # the trajectories of a serial run, the others draw from the shard
+        # seed, which only depends on the experiment uuid and on the shard
+        # position
+        nb_ex = nb_ex or self.nb_step
+        nb_shards = nb_shards or n_jobs
+
+        jobs = []
+        for name in sorted(self._groups.keys()):
+            for num_group, sub_group in enumerate(self._groups[name]):
+                sessions = sub_group.working_sessions
+                bounds = np.linspace(0, len(sessions), nb_shards + 1).astype(int)
+                for num_shard in range(nb_shards):
+                    if bounds[num_shard] == bounds[num_shard + 1]:
+                        continue
+                    seed = self.shard_seed(name, num_group, num_shard)
+                    jobs.append(((name, num_group), sessions[bounds[num_shard]:bounds[num_shard + 1]], nb_ex, batched, seed))
+
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            results = pool.map(run_shard, [job[1:] for job in jobs])
+        finally:
+            pool.close()
+            pool.join()
+
+        merged = {}
+        for job, sessions in zip(jobs, results):
+            merged.setdefault(job[0], []).extend(sessions)
+
+        for (name, num_group), sessions in merged.items():
+            self._groups[name][num_group].set_working_sessions(sessions)
+
+    def shard_seed(self, *keys):
+        key = "_".join([self.uuid] + [str(k) for k in keys])
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+    def paired_cost_diff(self):
+        # Differences of cost between the groups, student by student. Session
+        # i of the groups is the same student, with the same random numbers
+        # in paired mode : the t test is done on the paired differences
+        # (ttest_rel), pval_independent is the one of independent groups
+        cost = {name: np.concatenate(costs) for name, costs in self.calcul_cost().items()}
+        cost_diff = {}
+        for name_a, name_b in itertools.combinations(sorted(cost.keys()), 2):
+            diff = cost[name_a] - cost[name_b]
+            cost_diff["{}/{}".format(name_a, name_b)] = {
+                "mean": np.mean(diff),
+                "std_err": np.std(diff, ddof=1) / np.sqrt(len(diff)),
+                "pval": sstats.ttest_rel(cost[name_a], cost[name_b])[1],
+                "pval_independent": sstats.ttest_ind(cost[name_a], cost[name_b])[1]}
+        return cost_diff
 
     def merge(self, xp_bis):
         for key, groups in xp_bis.groups:
@@ -547,3 +793,15 @@ class Experiment(object):
 
     # Data Analysis tools
     ###########################################################################
+
+# class Experiment
+#########################################################
+
+
+def run_shard(shard):
+    # Process pool worker : run one shard of a WorkingGroup
+    working_sessions, nb_ex, batched, seed = shard
+    np.random.seed(seed)
+    group = WorkingGroup(WorkingSessions=working_sessions)
+    group.run(nb_ex, batched)
+    return group.working_sessions
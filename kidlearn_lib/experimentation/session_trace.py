@@ -0,0 +1,321 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        session_trace
+# Purpose:     Columnar storage of the steps of a working session
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+
+import copy
+import numbers
+import numpy as np
+
+# Recording levels, each level records the data of the previous ones
+#   none         : only the number of steps
+#   cost_only    : SessionStats updated at each step
+#   kc_levels    : KC levels of the student
+#   acts_answers : acts, answers and exercise levels
+#   full         : student and sequence manager states at each step
+RECORD_LEVELS = ["none", "cost_only", "kc_levels", "acts_answers", "full"]
+
+#########################################################
+#########################################################
+# class SessionStats
+
+
+class SessionStats(object):
+
+    """\
+        Statistics of the KC levels updated at each step : discounted cost
+        (from step 1 as WorkingSession.calcul_cost), total level, time of the
+        first maximum total level and first time each KC reached mastery.
+    """
+
+    def __init__(self, nb_kc, gamma=0.99, mastery=1, *args, **kwargs):
+        self.gamma = gamma
+        self.mastery = mastery
+        self.cost = 0
+        self.total_level = 0
+        self.max_level = None
+        self.time_max_level = 0
+        self.first_mastery = np.zeros(nb_kc, dtype=int) - 1
+
+    def update(self, time, kc_lvl):
+        total_level = sum(kc_lvl)
+        self.total_level = total_level
+        if time >= 1:
+            self.cost += pow(self.gamma, time) * total_level
+        if self.max_level is None or total_level > self.max_level:
+            self.max_level = total_level
+            self.time_max_level = time
+
+        mastered = (np.asarray(kc_lvl) >= self.mastery) & (self.first_mastery < 0)
+        self.first_mastery[mastered] = time
+
+# class SessionStats
+#########################################################
+
+#########################################################
+#########################################################
+# class SessionTrace
+
+
+class SessionTrace(object):
+
+    """\
+        Preallocated arrays with one row per step : KC levels of the student,
+        levels of the exercise, answer and act. Acts are stored as the value
+        index of each (ssbg, action) column, -1 when the ssbg is not used.
+        The sequence manager state is only copied every snapshot_every steps.
+        The record level (see RECORD_LEVELS) selects the columns kept.
+    """
+
+    def __init__(self, KC, capacity=101, snapshot_every=None, record="acts_answers", gamma=0.99, *args, **kwargs):
+        if record not in RECORD_LEVELS:
+            raise ValueError("unknown record level {}, use one of {}".format(record, RECORD_LEVELS))
+        self._KC = KC
+        self.record_level = record
+        self.gamma = gamma
+        self.student_id = None
+        if record == "full":
+            snapshot_every = 1
+        elif not self.records("acts_answers"):
+            snapshot_every = None
+        self.snapshot_every = snapshot_every
+
+        self._nb_step = 0
+        self.stats = SessionStats(len(KC), gamma) if self.records("cost_only") else None
+        self._act_cols = {}
+        self._act_keys = []
+        self._raw_acts = {}
+        self._snapshots = {}
+        self._student_states = []
+
+        nKC = len(KC)
+        kc_capacity = capacity if self.records("kc_levels") else 0
+        ex_capacity = capacity if self.records("acts_answers") else 0
+        self._kc_lvl = np.zeros((kc_capacity, nKC), dtype=np.float32)
+        self._ex_lvl = np.zeros((ex_capacity, nKC), dtype=np.float32)
+        self._answers = np.zeros(ex_capacity, dtype=np.int8)
+        self._acts = np.zeros((ex_capacity, 0), dtype=np.int32)
+
+    @property
+    def cost(self):
+        return self.stats.cost
+
+    def records(self, level):
+        return RECORD_LEVELS.index(self.record_level) >= RECORD_LEVELS.index(level)
+
+    def check_recorded(self, level):
+        if not self.records(level):
+            raise ValueError("{} are not recorded with the record level {}".format(level, self.record_level))
+
+    def __len__(self):
+        return self._nb_step
+
+    @property
+    def nb_step(self):
+        return self._nb_step
+
+    @property
+    def kc_lvl(self):
+        self.check_recorded("kc_levels")
+        return self._kc_lvl[:self._nb_step]
+
+    @property
+    def ex_lvl(self):
+        self.check_recorded("acts_answers")
+        return self._ex_lvl[:self._nb_step]
+
+    @property
+    def answers(self):
+        self.check_recorded("acts_answers")
+        return self._answers[:self._nb_step]
+
+    def reserve(self, capacity):
+        if self.records("kc_levels") and capacity > len(self._kc_lvl):
+            self._kc_lvl = self._resize(self._kc_lvl, capacity)
+        if self.records("acts_answers") and capacity > len(self._answers):
+            self._ex_lvl = self._resize(self._ex_lvl, capacity)
+            self._answers = self._resize(self._answers, capacity)
+            self._acts = self._resize(self._acts, capacity, -1)
+
+    @staticmethod
+    def _resize(data, capacity, fill=0):
+        new_data = np.empty((capacity,) + data.shape[1:], dtype=data.dtype)
+        new_data.fill(fill)
+        new_data[:len(data)] = data
+        return new_data
+
+    def _act_col(self, key, pos):
+        if (key, pos) not in self._act_cols:
+            self._act_cols[(key, pos)] = len(self._act_keys)
+            self._act_keys.append((key, pos))
+            new_col = np.empty((len(self._acts), 1), dtype=np.int32)
+            new_col.fill(-1)
+            self._acts = np.hstack([self._acts, new_col])
+        return self._act_cols[(key, pos)]
+
+    ###########################################################################
+    # Record
+
+    def record(self, student, seq_manager, exercise=None):
+        t = self._nb_step
+        self._nb_step += 1
+        if not self.records("cost_only"):
+            return
+
+        if self.student_id is None:
+            self.student_id = student._id
+        kc_lvl = student.get_kc_lvl()
+        self.stats.update(t, kc_lvl)
+        if not self.records("kc_levels"):
+            return
+
+        if t == len(self._kc_lvl):
+            self.reserve(max(2 * t, 1))
+        self._kc_lvl[t] = kc_lvl
+        if not self.records("acts_answers"):
+            return
+
+        if exercise is None:
+            self._answers[t] = -1
+        else:
+            self._answers[t] = exercise.answer
+            self._ex_lvl[t] = exercise.get_knowledges_level()
+            self.record_act(t, exercise.act)
+
+        if self.snapshot_every and t % self.snapshot_every == 0:
+            self._snapshots[t] = copy.deepcopy(seq_manager.get_state())
+        if self.records("full"):
+            self._student_states.append(copy.deepcopy(student.get_state()))
+
+    def record_act(self, t, act):
+        for key, vals in act.items():
+            for val in vals:
+                if not isinstance(val, numbers.Integral):
+                    self._raw_acts[t] = copy.deepcopy(act)
+                    return
+        for key, vals in act.items():
+            for pos, val in enumerate(vals):
+                col = self._act_col(key, pos)
+                self._acts[t, col] = val
+
+    # Record
+    ###########################################################################
+
+    ###########################################################################
+    # Read
+
+    def has_exercise(self, time):
+        self.check_recorded("acts_answers")
+        return self._answers[time] != -1
+
+    def get_kc_lvl(self, time):
+        self.check_recorded("kc_levels")
+        return self._kc_lvl[time]
+
+    def get_ex_lvl(self, time):
+        self.check_recorded("acts_answers")
+        return self._ex_lvl[time]
+
+    def get_answer(self, time):
+        self.check_recorded("acts_answers")
+        return self._answers[time]
+
+    def get_act(self, time):
+        if not self.has_exercise(time):
+            return None
+        if time in self._raw_acts:
+            return copy.deepcopy(self._raw_acts[time])
+        act = {}
+        for (key, pos), val in zip(self._act_keys, self._acts[time]):
+            if val >= 0:
+                act.setdefault(key, []).append((pos, int(val)))
+        return {key: [val for pos, val in sorted(vals)] for key, vals in act.items()}
+
+    def student_state(self, time):
+        if self.records("full"):
+            return self._student_states[time]
+        return {"id": self.student_id, "knowledges": self.get_kc_lvl(time)}
+
+    def seq_manager_state(self, time):
+        if time in self._snapshots:
+            return self._snapshots[time]
+        return {}
+
+    def exercise_state(self, time):
+        if not self.has_exercise(time):
+            return None
+        return {"act": self.get_act(time),
+                "answer": self.get_answer(time),
+                "knowledges": self.get_ex_lvl(time)}
+
+    def get_attr(self, time, attr, *arg):
+        # Read only the asked column
+        if attr == "exercise" and len(arg) > 0 and self.has_exercise(time):
+            if arg[0] == "act":
+                return self.get_act(time)
+            elif arg[0] == "answer":
+                return self.get_answer(time)
+            elif arg[0] == "knowledges":
+                return self.get_ex_lvl(time)
+        elif attr == "student" and len(arg) > 0 and arg[0] == "knowledges":
+            return self.get_kc_lvl(time)
+
+        data = getattr(self, "{}_state".format(attr))(time)
+        if len(arg) > 0:
+            if isinstance(data, dict):
+                return data[arg[0]]
+            else:
+                data = getattr(data, arg[0])
+        return data
+
+    # Read
+    ###########################################################################
+
+# class SessionTrace
+#########################################################
+
+#########################################################
+#########################################################
+# class TraceStepList
+
+
+class TraceStepList(object):
+
+    """\
+        List interface on a trace, steps are SessionStep views built on access
+    """
+
+    def __init__(self, trace):
+        self._trace = trace
+
+    def __len__(self):
+        return self._trace.nb_step
+
+    def __getitem__(self, time):
+        # Import here, experimentation module uses the trace
+        from .experimentation import SessionStep
+
+        if isinstance(time, slice):
+            return [self[t] for t in range(*time.indices(len(self)))]
+        if time < 0:
+            time += len(self)
+        if time < 0 or time >= len(self):
+            raise IndexError("step index out of range")
+        return SessionStep(trace=self._trace, time=time)
+
+    def __iter__(self):
+        for time in range(len(self)):
+            yield self[time]
+
+    def __repr__(self):
+        return list(self).__repr__()
+
+# class TraceStepList
+#########################################################
@@ -14,8 +14,10 @@ import re
 import pickle
 import json
 import copy
+import contextlib
 import os
 import sys
+import time
 import numpy as np
 import math
 
@@ -110,14 +112,68 @@ def recupData(path_data=None, directory="HSSBG_TEST1", studModel=-1):
     return all_data
 
 
-def load_json(file_name, dir_path=""):
+def load_json(file_name, dir_path="", cached=False):
     file_name = file_name.split(".")[0] + ".json"
     path = os.path.join(dir_path, file_name)
+    if cached:
+        # New objects decoded from the cached text of the file
+        return json.loads(load_cached_or_raise(path, read_text))
+
     with open(path, 'rb') as fp:
         json_data = json.load(fp)
 
     return json_data
 
+# Files parsed once per process : parser(path) is called again only when the
+# mtime of the file changed, the mtime is checked at most every
+# file_cache_delay seconds. None for a file which does not exist. The parsed
+# data is shared, it must not be modified
+
+file_cache_delay = 1.0
+_file_cache = {}
+
+
+def load_file_cached(path, parser):
+    key = (os.path.abspath(path), parser)
+    entry = _file_cache.get(key)
+    now = time.time()
+    if entry is not None and now - entry["checked"] < file_cache_delay:
+        return entry["data"]
+
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    if entry is None or entry["mtime"] != mtime:
+        entry = {"mtime": mtime, "data": parser(path) if mtime is not None else None}
+        _file_cache[key] = entry
+    entry["checked"] = now
+    return entry["data"]
+
+
+def load_cached_or_raise(path, parser):
+    data = load_file_cached(path, parser)
+    if data is None:
+        raise IOError("No such file: {}".format(path))
+    return data
+
+
+def read_text(path):
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+def read_json(path):
+    with open(path, 'rb') as fp:
+        return json.load(fp)
+
+
+def load_json_cached(file_name, dir_path=""):
+    # Shared json data, see load_json(cached=True) for a copy
+    file_name = file_name.split(".")[0] + ".json"
+    return load_cached_or_raise(os.path.join(dir_path, file_name), read_json)
+
+
+def clear_file_cache():
+    _file_cache.clear()
+
 ###############################################################################
 # Auxiliary functions
 ###############################################################################
@@ -137,12 +193,111 @@ def spe_split(regex, line):
     tmp = [x for x in tmp if x not in [None, '']]
     return tmp
 
-# SSB function to sample bandit
+# Random stream of the simulation draws : np.random, or the RandomState made
+# current by random_stream (a WorkingSession makes its own one current while
+# it runs, see experimentation)
+
+_random_states = []
+
+
+def rng():
+    if _random_states:
+        return _random_states[-1]
+    return np.random
+
+
+@contextlib.contextmanager
+def random_stream(random_state):
+    # None keeps the current stream
+    if random_state is None:
+        yield
+        return
+    _random_states.append(random_state)
+    try:
+        yield
+    finally:
+        _random_states.pop()
+
+# Seed of the stream of session num_session of an experiment, the same for
+# every group of the experiment so their sessions draw the same numbers. The
+# other streams of a session are numbered by stream
+
+
+def session_seed(seed, num_session, stream=None):
+    if stream is None:
+        return [seed, num_session]
+    return [seed, num_session, stream]
+
+# SSB function to sample bandit : index of a categorical distribution, the
+# weights are normalized by their sum
 
 
 def dissample(p):
-    s = np.random.multinomial(1, p)
-    return np.nonzero(s == 1)[0][0]
+    cum_p = np.cumsum(p)
+    idx = cum_p.searchsorted(rng().random_sample() * cum_p[-1], "right")
+    return min(int(idx), len(cum_p) - 1)
+
+# dissample on each row of p, random_states : stream of each row (see
+# random_sample_rows)
+
+
+def dissample_rows(p, random_states=None):
+    cum_p = np.cumsum(p, axis=1)
+    r = random_sample_rows(np.arange(len(cum_p)), random_states) * cum_p[:, -1]
+    return np.minimum((r[:, np.newaxis] >= cum_p).sum(axis=1), cum_p.shape[1] - 1)
+
+# One uniform for each row of rows (indexes) : drawn in the stream of the row
+# when random_states gives one RandomState per row, as the session of the
+# row would draw it, else drawn at once with rng()
+
+
+def random_sample_rows(rows, random_states=None):
+    if random_states is None:
+        return rng().random_sample(len(rows))
+    return np.array([random_states[i].random_sample() for i in rows], dtype=float)
+
+# Sample 1 with probability p, 0 otherwise
+
+
+def bernoulli(p, u=None):
+    # u : uniform to use instead of a draw of rng()
+    if u is None:
+        u = rng().random_sample()
+    return int(u < p)
+
+# Clone of a sequence manager or a student : deepcopy of obj where the
+# objects of shared (its model data) are not copied but shared
+
+
+def clone(obj, shared):
+    memo = {id(x): x for x in shared}
+    return copy.deepcopy(obj, memo)
+
+# State of an object with __slots__ as one dict, for pickle and copy : the
+# slots of its classes and its __dict__ if it has one. States pickled before
+# the slots are dicts too
+
+_slots_names = {}
+
+
+def slots_names(cls):
+    if cls not in _slots_names:
+        _slots_names[cls] = [key for c in cls.__mro__ for key in c.__dict__.get("__slots__", ())
+                             if key not in ("__dict__", "__weakref__")]
+    return _slots_names[cls]
+
+
+def slots_getstate(obj):
+    state = {key: getattr(obj, key) for key in slots_names(type(obj)) if hasattr(obj, key)}
+    extra = getattr(obj, "__dict__", None)
+    if extra:
+        state.update(extra)
+    return state
+
+
+def slots_setstate(obj, state):
+    for key, val in state.items():
+        object.__setattr__(obj, key, val)
 
 # Default value for argument from dictionaries
 
@@ -11,7 +11,14 @@
 
 #-------------------------------------------------------------------------------
 
+from .. import functions as func
+
 class Knowledge(object):
+
+    # __dict__ holds the extra attributes of kwargs, it is only allocated
+    # when one is set
+    __slots__ = ("_name", "_level", "__dict__")
+
     def __init__(self, name, level=0, *args, **kwargs):
         self._name = name
         self._level = level
@@ -19,6 +26,12 @@ class Knowledge(object):
         for key, val in kwargs.iteritems():
             object.__setattr__(self, key, val)
 
+    def __getstate__(self):
+        return func.slots_getstate(self)
+
+    def __setstate__(self, state):
+        func.slots_setstate(self, state)
+
     @property
     def name(self):
         return self._name
@@ -18,6 +18,7 @@ import json
 from operator import mul
 
 from .knowledge import Knowledge
+from .. import functions as func
 
 ################################################################################
 ################################################################################
@@ -26,6 +27,8 @@ from .knowledge import Knowledge
 
 class KTKnowledge(Knowledge):
 
+    __slots__ = ("params", "p_L0", "p_T", "p_G", "p_S")
+
     def __init__(self, name=None, level=None, params=None):  # KT_params = None, level = 0, num_id = None):
         Knowledge.__init__(self, name, level)
         self.params = params
@@ -46,7 +49,7 @@ class KTKnowledge(Knowledge):
 
     # knowledge = 0 or 1 , updated at each step
     ###################################################
-    def update_state(self, prob=None, adding_prob=0, pT_idx=0):
+    def update_state(self, prob=None, adding_prob=0, pT_idx=0, u=None):
         if prob is not None:
             prob = prob
         else:
@@ -54,9 +57,7 @@ class KTKnowledge(Knowledge):
 
         if self._level != 1:
             # print prob
-            learn = np.random.multinomial(1, [1 - prob, prob])
-            learn = np.nonzero(learn == 1)[0][0]
-            if learn:
+            if func.bernoulli(prob, u):
                 self._level = 1
 
     ###################################################
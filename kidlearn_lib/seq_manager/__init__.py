@@ -1,9 +1,11 @@
 from .hssbg import * #HierarchicalSSBG 
 from .riarit import *  #RiaritHssbg
 from .zpdes import * #ZpdesHssbg
+from .batched_zpdes import BatchedZpdesHssbg
 from .teacher_sequence import Sequence
 from .random_sequence import RandomSequence
 from .pomdp import POMDP,perseus
+from .batched_pomdp import BatchedPOMDP
 
 seq_dict_gen = {}
 seq_dict_gen["RiaritHssbg"] = RiaritHssbg
@@ -0,0 +1,89 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        BatchedPOMDP
+# Purpose:     POMDP sequence manager for a cohort of students
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+from .pomdp import POMDP
+
+#########################################################
+#########################################################
+# class BatchedPOMDP
+
+
+class BatchedPOMDP(object):
+
+    """\
+        POMDP for N students sharing the same model and policy. The tracker
+        states of the beliefs are the rows of a (N, ...) array, the actions
+        of the whole cohort are chosen with one POMDP.sample_batch call. Acts
+        are (N,) arrays of action indexes.
+    """
+
+    # Random stream of each student, None : draws of func.rng()
+    random_states = None
+
+    def __init__(self, pomdp, nb_students=1, beliefs=None, *args, **kwargs):
+        self.pomdp = pomdp
+        self.nb_students = nb_students
+        if beliefs is None:
+            beliefs = [pomdp.current_belief] * nb_students
+        self.beliefs = np.array(beliefs, dtype=float)
+
+    @classmethod
+    def from_seq_managers(cls, seq_managers):
+        # Model of the first one, belief of each of them
+        return cls(seq_managers[0], len(seq_managers), [sm.current_belief for sm in seq_managers])
+
+    @staticmethod
+    def is_batchable(seq_managers):
+        if not all(type(sm) is POMDP for sm in seq_managers):
+            return False
+        pomdp = seq_managers[0]
+        for sm in seq_managers[1:]:
+            if sm.params != pomdp.params:
+                return False
+            if sm.alpha_v is not pomdp.alpha_v and not np.array_equal(sm.alpha_v, pomdp.alpha_v):
+                return False
+        return True
+
+    @property
+    def main_act(self):
+        return self.pomdp.main_act
+
+    def sample(self):
+        return self.pomdp.sample_batch(self.pomdp.belief_tracker.belief(self.beliefs), self.random_states)
+
+    def compute_act_lvl(self, acts, RT="main", **kwargs):
+        lvl = np.zeros((self.nb_students, self.pomdp._nA))
+        lvl[np.arange(self.nb_students), acts] = 1
+        return lvl
+
+    def get_act(self, acts, num_stud):
+        return {self.main_act: [int(acts[num_stud])]}
+
+    def update(self, acts, answers, *args):
+        # Observation 0 is the right answer, as in POMDP.update
+        obs = 1 - np.asarray(answers)
+        for a in np.unique(acts):
+            rows = np.flatnonzero(acts == a)
+            self.beliefs[rows] = self.pomdp.belief_tracker.update(self.beliefs[rows], a, obs[rows])
+
+    def get_state(self, num_stud=None):
+        if num_stud is None:
+            return {"belief": self.beliefs}
+        return {"belief": self.beliefs[num_stud]}
+
+    def free_data(self):
+        self.beliefs = None
+
+# class BatchedPOMDP
+#########################################################
@@ -0,0 +1,430 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        BatchedZpdes
+# Purpose:     ZPDES for a cohort of students stored in arrays
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+from .zpdes import ZpdesHssbg
+from .. import functions as func
+
+
+def window_mean(cum, nb, start, stop):
+    # np.mean(success[start:stop]) from the running sums ring cum, where
+    # cum[..., k % size] is the sum of the k first answers (NaN when empty)
+    size = cum.shape[-1]
+    start = np.where((start > 0) | (stop < nb), np.maximum(start, nb - (size - 1)), start)
+    sum_start = np.where(start == 0, 0, np.take_along_axis(cum, (start % size)[..., None], -1)[..., 0])
+    sum_stop = np.take_along_axis(cum, (stop % size)[..., None], -1)[..., 0]
+    length = stop - start
+    return np.where(length > 0, (sum_stop - sum_start) / np.maximum(length, 1), np.nan)
+
+
+def slice_start(nb, first_step):
+    # Absolute start of success[first_step:] for a first_step <= 0
+    if first_step == 0:
+        return np.zeros_like(nb)
+    return np.maximum(nb + first_step, 0)
+
+#########################################################
+#########################################################
+# class BatchedZpdesHssbg
+
+
+class BatchedZpdesHssbg(object):
+
+    """\
+        ZpdesHssbg for N students. The graph of a ZpdesHssbg is compiled once
+        in index tables and the state of the students (bandit values, success
+        rings, acts) is stored in (N, ...) arrays for each SSB and SSBG.
+        sample and update work on the whole cohort, acts are (N, nb_ssbg,
+        nb_actions) arrays with -1 for the SSBG not used.
+    """
+
+    # Random stream of each student, None : draws of func.rng()
+    random_states = None
+
+    def __init__(self, params=None, nb_students=1, params_file="seq_test_1", directory="params_files", template=None, *args, **kwargs):
+        if template is None:
+            params = params or func.load_json(params_file, directory, cached=True)
+            template = ZpdesHssbg(params=params)
+
+        self.compile_graph(template)
+        self.nb_students = nb_students
+        self.load_states([template] * nb_students)
+
+    @classmethod
+    def from_seq_managers(cls, seq_managers):
+        # Structure of the first one, state of each of them
+        batch = cls.__new__(cls)
+        batch.compile_graph(seq_managers[0])
+        batch.nb_students = len(seq_managers)
+        batch.load_states(seq_managers)
+        return batch
+
+    @staticmethod
+    def is_batchable(seq_managers):
+        if not all(type(sm) is ZpdesHssbg for sm in seq_managers):
+            return False
+        params = seq_managers[0].params
+        return all(sm.params == params for sm in seq_managers)
+
+    @property
+    def main_act(self):
+        return self._main_act
+
+    ###########################################################################
+    # Graph compilation
+
+    def compile_graph(self, template):
+        self.template = template
+        self._main_act = template.main_act
+        self.ncompetencies = template.ncompetencies
+
+        self.ssbg_names = sorted(template.SSBGs.keys())
+        self.ssbg_idx = {name: g for g, name in enumerate(self.ssbg_names)}
+        self.main_idx = self.ssbg_idx[self._main_act]
+        self.nactions = [template.SSBGs[name].nactions for name in self.ssbg_names]
+        self.max_actions = max(self.nactions)
+        self.nb_stay = [np.array(template.SSBGs[name].nb_stay) for name in self.ssbg_names]
+        self._act_order = {}
+
+        # SSB j of action a of SSBG g : self.ssb_idx[g][a]
+        self.ssb_idx = []
+        self.ssbs = []
+        for name in self.ssbg_names:
+            self.ssb_idx.append([])
+            for ssb in template.SSBGs[name].SSB:
+                self.ssb_idx[-1].append(len(self.ssbs))
+                self.ssbs.append(ssb)
+
+        self.nval = [ssb.nval for ssb in self.ssbs]
+        self.params_ssb = [{"filter1": ssb.filter1,
+                            "filter2": ssb.filter2,
+                            "uniformval": ssb.uniformval,
+                            "stepUpdate": ssb.stepUpdate,
+                            "stepMax": ssb.stepMax,
+                            "size_window": ssb.size_window,
+                            "upZPDval": ssb.upZPDval,
+                            "deactZPDval": ssb.deactZPDval,
+                            "promote_coeff": ssb.promote_coeff,
+                            "h_promote_coeff": ssb.h_promote_coeff,
+                            "thresHProm": ssb.thresHProm,
+                            "thresHDeact": ssb.thresHDeact,
+                            "spe_promo": ssb.spe_promo,
+                            "is_hierarchical": ssb.is_hierarchical} for ssb in self.ssbs]
+
+        # child[g][a][v] : SSBG sampled after the value v of action a, or -1
+        self.child = []
+        for name in self.ssbg_names:
+            ssbg = template.SSBGs[name]
+            self.child.append([[self.ssbg_idx[val] if hierar else -1 for val, hierar in zip(values, children)]
+                               for values, children in zip(ssbg.param_values, ssbg.values_children)])
+
+        # son[j][v] : son SSBG read by the hierarchical promotion, or -1
+        self.son = []
+        for ssb in self.ssbs:
+            if len(ssb.sonSSBG) == 0:
+                self.son.append(None)
+                continue
+            son = [self.ssbg_idx[val] if val in ssb.sonSSBG else -1 for val in ssb.param_values]
+            if -1 in son and ssb.is_hierarchical:
+                raise ValueError("values {} of {} have no son SSBG to promote".format(ssb.param_values, ssb.id))
+            self.son.append(son)
+
+        # Exercise level of the first action value of each SSBG
+        self.lvl_table = []
+        for name in self.ssbg_names:
+            values = template.SSBGs[name].SSB[0].param_values
+            lvl = np.zeros((len(values), self.ncompetencies))
+            for v, val in enumerate(values):
+                for i in range(self.ncompetencies):
+                    if str(val) == "V{}".format(i + 1):
+                        lvl[v, i] = 1
+            self.lvl_table.append(lvl)
+
+    def load_states(self, seq_managers):
+        self._bandval = []
+        self._success = []
+        self._cum_success = []
+        self._nb_success = []
+        for j in range(len(self.ssbs)):
+            g, a = self.ssb_position(j)
+            ssbs = [sm.SSBGs[self.ssbg_names[g]].SSB[a] for sm in seq_managers]
+            self._bandval.append(np.array([ssb.bandval for ssb in ssbs], dtype=float))
+            self._success.append(np.array([ssb._success for ssb in ssbs]))
+            self._cum_success.append(np.array([ssb._cum_success for ssb in ssbs]))
+            self._nb_success.append(np.array([ssb._nb_success for ssb in ssbs]))
+
+        self._act = []
+        self._nbturn = []
+        for name in self.ssbg_names:
+            ssbgs = [sm.SSBGs[name] for sm in seq_managers]
+            self._act.append(np.array([ssbg.act for ssbg in ssbgs], dtype=int))
+            self._nbturn.append(np.array([ssbg.nbturn for ssbg in ssbgs], dtype=int))
+
+    def ssb_position(self, j):
+        for g, ssb_idx in enumerate(self.ssb_idx):
+            if j in ssb_idx:
+                return g, ssb_idx.index(j)
+
+    # Graph compilation
+    ###########################################################################
+
+    ###########################################################################
+    # Sample
+
+    def sample(self):
+        self._used = np.zeros((self.nb_students, len(self.ssbg_names)), dtype=bool)
+        self.sample_ssbg(self.main_idx, np.arange(self.nb_students))
+
+        acts = np.zeros((self.nb_students, len(self.ssbg_names), self.max_actions), dtype=int) - 1
+        for g in range(len(self.ssbg_names)):
+            rows = self._used[:, g]
+            acts[rows, g, :self.nactions[g]] = self._act[g][rows]
+        return acts
+
+    def sample_ssbg(self, g, rows):
+        # HierarchicalSSBG.speSample for the students rows
+        for a in range(self.nactions[g]):
+            resample = rows[self._nbturn[g][rows, a] % self.nb_stay[g][a] == 0]
+            if len(resample) > 0:
+                self._act[g][resample, a] = self.sample_ssb(self.ssb_idx[g][a], resample)
+                self._nbturn[g][resample, a] = 0
+        self._used[rows, g] = True
+
+        for a in range(self.nactions[g]):
+            for v, child in enumerate(self.child[g][a]):
+                if child >= 0:
+                    sub_rows = rows[self._act[g][rows, a] == v]
+                    if len(sub_rows) > 0:
+                        self.sample_ssbg(child, sub_rows)
+
+    def get_prob_distrib(self, j, rows, exploration_coeff=10):
+        bandval = self._bandval[j][rows]
+        active = bandval != 0
+        single = active.sum(axis=1) == 1
+        if single.any():
+            bandval = np.where(single[:, None] & active, self.params_ssb[j]["uniformval"], bandval)
+            self._bandval[j][rows] = bandval
+        prob = np.where(bandval > 0, bandval + bandval.sum(axis=1)[:, None] / exploration_coeff, bandval)
+        return prob / prob.sum(axis=1)[:, None]
+
+    def sample_ssb(self, j, rows, exploration_coeff=10):
+        cum_prob = np.cumsum(self.get_prob_distrib(j, rows, exploration_coeff), axis=1)
+        uniform = func.random_sample_rows(rows, self.random_states) * cum_prob[:, -1]
+        return np.minimum((cum_prob < uniform[:, None]).sum(axis=1), self.nval[j] - 1)
+
+    # Sample
+    ###########################################################################
+
+    def compute_act_lvl(self, acts, RT="main", **kwargs):
+        if self.template.riarit is not None:
+            return np.array([self.template.compute_act_lvl(self.get_act(acts, i), RT) for i in range(self.nb_students)], dtype=float)
+        lvl = np.zeros((self.nb_students, self.ncompetencies))
+        for g in range(len(self.ssbg_names)):
+            rows = acts[:, g, 0] >= 0
+            lvl[rows] = np.maximum(lvl[rows], self.lvl_table[g][acts[rows, g, 0]])
+        return lvl
+
+    def get_act(self, acts, num_stud):
+        act = {}
+        for g in self.act_order(acts[num_stud, :, 0] >= 0):
+            act[self.ssbg_names[g]] = [int(val) for val in acts[num_stud, g, :self.nactions[g]]]
+        return act
+
+    def act_order(self, used):
+        # SSBGs used in the order speSample adds them to act
+        key = tuple(used)
+        if key not in self._act_order:
+            order = []
+            self.fill_act_order(self.main_idx, used, order)
+            self._act_order[key] = order
+        return self._act_order[key]
+
+    def fill_act_order(self, g, used, order):
+        order.append(g)
+        for children in self.child[g]:
+            for child in children:
+                if child >= 0 and used[child] and child not in order:
+                    self.fill_act_order(child, used, order)
+
+    ###########################################################################
+    # Update
+
+    def update(self, acts, answers, *args):
+        # Students with the same SSBGs used are updated together, in the
+        # order of ZpdesHssbg.update
+        answers = np.asarray(answers, dtype=float)
+        used = acts[:, :, 0] >= 0
+        patterns, pattern_idx = np.unique(used, axis=0, return_inverse=True)
+        for p, pattern in enumerate(patterns):
+            rows = np.flatnonzero(pattern_idx == p)
+            for g in self.update_order(pattern):
+                self.update_ssbg(g, rows, acts[rows, g, :self.nactions[g]], answers[rows])
+
+    def update_order(self, used):
+        # Order of act.keys() for an act dict filled as in speSample
+        act = {self.ssbg_names[g]: g for g in self.act_order(used)}
+        return act.values()
+
+    def update_ssbg(self, g, rows, vals, answers):
+        # ZpdesSsbg.update
+        rewards = [self.calcul_reward_ssb(self.ssb_idx[g][a], rows, vals[:, a], answers) for a in range(self.nactions[g])]
+        for a in range(self.nactions[g]):
+            j = self.ssb_idx[g][a]
+            self._nbturn[g][rows, a] += 1
+            bandval = self._bandval[j][rows, vals[:, a]]
+            self._bandval[j][rows, vals[:, a]] = self.params_ssb[j]["filter1"] * bandval + self.params_ssb[j]["filter2"] * rewards[a]
+            self.promote(j, rows)
+
+    def add_success(self, j, rows, vals, answers):
+        nb_success = self._nb_success[j][rows, vals]
+        size = self._success[j].shape[2]
+        self._success[j][rows, vals, nb_success % size] = answers
+        cum_success = self._cum_success[j][rows, vals, nb_success % (size + 1)]
+        self._cum_success[j][rows, vals, (nb_success + 1) % (size + 1)] = cum_success + answers
+        self._nb_success[j][rows, vals] = nb_success + 1
+
+    def calcul_reward_ssb(self, j, rows, vals, answers):
+        self.add_success(j, rows, vals, answers)
+        nb_success = self._nb_success[j][rows, vals]
+        cum_success = self._cum_success[j][rows, vals]
+
+        y_step = np.minimum(self.params_ssb[j]["stepUpdate"], nb_success)
+        y_range = y_step / 2
+        range_start = np.where(y_range == 0, 0, nb_success - y_range)
+        sum_old = window_mean(cum_success, nb_success, np.where(y_step == 0, 0, nb_success - y_step), range_start)
+        sum_range = window_mean(cum_success, nb_success, range_start, nb_success)
+        with np.errstate(invalid="ignore"):
+            diff = sum_range - sum_old
+            reward = np.where(diff > 0, diff, 0)
+
+        return np.where(nb_success > 2, reward, self._bandval[j][rows, vals])
+
+    def success_rate(self, j, rows, first_step, min_nb_ans=2):
+        # ZpdesSsb.success_rate of each value
+        nb_success = self._nb_success[j][rows]
+        start = slice_start(nb_success, first_step)
+        mean = window_mean(self._cum_success[j][rows], nb_success, start, nb_success)
+        return np.where(nb_success - start < min_nb_ans, 0, mean)
+
+    def promote(self, j, rows):
+        params = self.params_ssb[j]
+        if not params["is_hierarchical"]:
+            return
+        if self.son[j] is not None:
+            self.hierarchical_promote_async(j, rows)
+        elif params["spe_promo"] == 0:
+            self.spe_promote_async(j, rows)
+        else:
+            self.spe_promote_windows(j, rows)
+
+    def hsuccess_rate(self, g, rows, first_step):
+        # Success rate of each value of the hierarchical SSB of a son SSBG
+        return [self.success_rate(j, rows, first_step) for j in self.ssb_idx[g] if self.params_ssb[j]["is_hierarchical"]]
+
+    def hierarchical_promote_async(self, j, rows):
+        params = self.params_ssb[j]
+        bandval = self._bandval[j][rows]
+        nb_success = self._nb_success[j][rows]
+        for i in range(1, self.nval[j]):
+            rates_i1 = self.hsuccess_rate(self.son[j][i - 1], rows, -params["stepMax"])
+            mean_i1 = np.mean([rates.mean(axis=1) for rates in rates_i1], axis=0)
+
+            rates_i = self.hsuccess_rate(self.son[j][i], rows, -params["stepUpdate"])
+            min_i = np.min([rates.min(axis=1) for rates in rates_i], axis=0)
+
+            nb_not_active = self.nval[j] - np.count_nonzero(bandval, axis=1)
+            promote = (bandval[:, i] == 0) & (nb_success[:, i] == 0) & (mean_i1 > params["thresHProm"])
+            deact = (bandval[:, i] != 0) & (min_i > params["thresHDeact"]) & (nb_not_active < self.nval[j] - 1)
+            bandval[:, i] = np.where(promote, bandval[:, i - 1] * params["h_promote_coeff"], bandval[:, i])
+            bandval[deact, i] = 0
+        self._bandval[j][rows] = bandval
+
+    def spe_promote_async(self, j, rows):
+        params = self.params_ssb[j]
+        bandval = self._bandval[j][rows]
+        nb_success = self._nb_success[j][rows]
+        row_idx = np.arange(len(rows))
+
+        active = bandval != 0
+        rates = self.success_rate(j, rows, -params["stepMax"])
+        nb_active = active.sum(axis=1)
+        succrate_active = np.where(nb_active > 0, (rates * active).sum(axis=1) / np.maximum(nb_active, 1), 0)
+
+        not_used = nb_success == 0
+        promote = (succrate_active > params["upZPDval"]) & not_used.any(axis=1)
+        min_active = np.where(active, bandval, np.inf).min(axis=1)
+        first_not_used = not_used.argmax(axis=1)
+        bandval[row_idx[promote], first_not_used[promote]] = min_active[promote] * params["promote_coeff"]
+
+        # As in ZpdesSsb, the argmax of the usable values is read in the list
+        # of all the active values
+        active = bandval != 0
+        usable = active & (nb_success >= params["stepUpdate"])
+        rates = self.success_rate(j, rows, -params["stepUpdate"])
+        rank = np.cumsum(usable, axis=1)[row_idx, np.where(usable, rates, -np.inf).argmax(axis=1)] - 1
+        imaxd = (np.cumsum(active, axis=1) == (rank + 1)[:, None]).argmax(axis=1)
+
+        nb_not_active = self.nval[j] - np.count_nonzero(bandval, axis=1)
+        deact = usable.any(axis=1) & (rates[row_idx, imaxd] > params["deactZPDval"]) & (nb_not_active < self.nval[j] - 1)
+        bandval[row_idx[deact], imaxd[deact]] = 0
+        self._bandval[j][rows] = bandval
+
+    def spe_promote_windows(self, j, rows):
+        params = self.params_ssb[j]
+        nval = self.nval[j]
+        bandval = self._bandval[j][rows]
+        nb_success = self._nb_success[j][rows]
+        row_idx = np.arange(len(rows))
+
+        # Promote initialisation for beginning of the sequence with less than windows size bandit activated
+        not_used = nb_success == 0
+        begin = nval - not_used.sum(axis=1) < params["size_window"]
+        first_not_used = not_used.argmax(axis=1)
+        prev = (first_not_used - 1) % nval
+        rates = self.success_rate(j, rows, -params["stepMax"])
+        promote = begin & (rates[row_idx, prev] > params["upZPDval"]) & (nb_success[row_idx, prev] > 1)
+        bandval[row_idx[promote], first_not_used[promote]] = bandval[row_idx[promote], prev[promote]]
+
+        active = bandval != 0
+        first = active.argmax(axis=1)
+        last = nval - 1 - active[:, ::-1].argmax(axis=1)
+        nb_first = nb_success[row_idx, first] - slice_start(nb_success[row_idx, first], -params["stepMax"])
+        mean_first = np.where(nb_first > 0, self.success_rate(j, rows, -params["stepMax"], min_nb_ans=0)[row_idx, first], 0)
+        deact = ~begin & (nb_first > 0) & (mean_first > params["deactZPDval"]) & (nb_success[row_idx, last] >= params["stepMax"]) & (first != last)
+        bandval[row_idx[deact], first[deact]] = 0
+        up = deact & (first + 3 < nval)
+        bandval[row_idx[up], first[up] + 3] = np.minimum(bandval[row_idx[up], first[up] + 2], bandval[row_idx[up], first[up] + 1]) / 2
+        self._bandval[j][rows] = bandval
+
+    # Update
+    ###########################################################################
+
+    def get_state(self, num_stud=None):
+        # Bandit values as HierarchicalSSBG.get_state
+        bandval = {}
+        for g, name in enumerate(self.ssbg_names):
+            if num_stud is None:
+                bandval[name] = [self._bandval[j] for j in self.ssb_idx[g]]
+            else:
+                bandval[name] = [self._bandval[j][num_stud] for j in self.ssb_idx[g]]
+        return {"bandval": bandval}
+
+    def free_data(self):
+        # Structure is kept to read the acts
+        self._bandval = None
+        self._success = None
+        self._cum_success = None
+        self._nb_success = None
+
+# class BatchedZpdesHssbg
+#########################################################
@@ -0,0 +1,100 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        belief_tracker
+# Purpose:     Belief representations followed by the POMDP between steps
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+# A tracker state is what POMDP keeps in current_belief, trackers work on
+# one state or on a (N, ...) array of states :
+#   initial()            -> state at the beginning of a session
+#   update(state, a, z)  -> state after action a and observation z
+#   belief(state)        -> (..., nS) belief used for the decisions
+
+#########################################################
+#########################################################
+# class ExactBelief
+
+
+class ExactBelief(object):
+
+    """\
+        Full belief over the nS states, updated with POMDP.blfUpdt
+    """
+
+    def __init__(self, pomdp):
+        self.pomdp = pomdp
+
+    def initial(self):
+        return np.array(self.pomdp._s0, dtype=float)
+
+    def update(self, state, a, z):
+        if np.ndim(state) == 1:
+            return self.pomdp.blfUpdt(state, a, z)
+        return self.pomdp.blfUpdt_batch(state, a, np.asarray(z))
+
+    def belief(self, state):
+        return state
+
+# class ExactBelief
+#########################################################
+
+#########################################################
+#########################################################
+# class FactoredKTBelief
+
+
+class FactoredKTBelief(object):
+
+    """\
+        Probability that each KC is learned, the KC are supposed
+        independent. Action a learns KC a with the KT transition computed on
+        the expected levels, then the observation updates KC a only : O(nA)
+        per update. The full belief is their product.
+    """
+
+    def __init__(self, pomdp):
+        # Only the factored KT transitions give the learned KC of each state,
+        # a manual model or a dense POMDP loaded from an old file has none
+        if not hasattr(pomdp._T, "learned"):
+            raise ValueError("factored belief tracker needs the KT transitions of the POMDP, "
+                             "{} has {} : use belief_tracker \"exact\"".format(
+                                 getattr(pomdp, "_ref", "POMDP"), type(pomdp._T).__name__))
+        self.p_transitions = np.asarray(pomdp._Pt, dtype=float)
+        self.trans_dep = np.asarray(pomdp._trans_dep, dtype=float)
+        self.learned = pomdp._T.learned
+
+        # Observation probabilities of a learned and of a not learned KC
+        self.obs_learned = np.array([1 - pomdp._Ps, pomdp._Ps])
+        self.obs_not_learned = np.array([pomdp._Pg, 1 - pomdp._Pg])
+        self.s0 = pomdp._s0
+
+    def initial(self):
+        return np.dot(self.s0, self.learned).astype(float)
+
+    def update(self, state, a, z):
+        state = np.array(state, dtype=float)
+        m = state[..., a]
+        p_learn = self.p_transitions[a] + np.dot(state, self.trans_dep[a])
+        m = m + (1 - m) * p_learn
+
+        lik_learned = m * self.obs_learned[z]
+        lik_not_learned = (1 - m) * self.obs_not_learned[z]
+        state[..., a] = lik_learned / (lik_learned + lik_not_learned)
+        return state
+
+    def belief(self, state):
+        state = np.asarray(state)[..., np.newaxis, :]
+        return np.prod(np.where(self.learned, state, 1 - state), axis=-1)
+
+# class FactoredKTBelief
+#########################################################
+
+belief_trackers = {"exact": ExactBelief, "factored": FactoredKTBelief}
@@ -11,7 +11,6 @@
 #-------------------------------------------------------------------------
 
 import numpy as np
-import itertools
 import copy
 
 from .. import functions as func
@@ -39,8 +38,33 @@ class HierarchicalSSBG(object):
         #RT = "%s/%s.txt" % (self.graph_path, self.main_act)
         self.CreateHSSBG(self.params["graph"])
 
+        # State of a new session, for fresh_state
+        self._initial_bandval = copy.deepcopy(self.getBanditValue())
+        self._initial_success = copy.deepcopy(self.getSuccess())
+
         return
 
+    # Clones share the graph and the params, the bandit values and successes
+    # are copied
+    def shared_data(self):
+        shared = [self.params, self._initial_bandval, self._initial_success]
+        for ssbg in self.SSBGs.values():
+            shared += ssbg.shared_data()
+        return shared
+
+    def clone(self):
+        return func.clone(self, self.shared_data())
+
+    def fresh_state(self):
+        # Clone at the state of a new session
+        seq = self.clone()
+        seq.setBanditValue(copy.deepcopy(self._initial_bandval))
+        seq.setSuccess(copy.deepcopy(self._initial_success))
+        for ssbg in seq.SSBGs.values():
+            ssbg.act = [0] * ssbg.nactions
+            ssbg.nbturn = [0] * ssbg.nactions
+        return seq
+
     def get_state(self):
         state = {}
         state["bandval"] = self.getBanditValue()
@@ -107,12 +131,11 @@ class HierarchicalSSBG(object):
     def update(self, act=None, result=True, error_ID=None, *args, **kwargs):
         return 0
 
-    def choice_sample(self):
-        act_distrib = self.get_probDistribAct()
-        act_distrib = zip(*act_distrib)
-        act = np.random.choice(act_distrib[0], p=act_distrib[1])
+    def act_distribution(self):
+        return ActDistribution(self)
 
-        return act
+    def choice_sample(self):
+        return self.act_distribution().sample()
 
     def sample(self):
         act = self.speSample(ssbgToS=self.SSBGs[self.main_act])
@@ -130,56 +153,135 @@ class HierarchicalSSBG(object):
                 self.speSample(self.SSBGs[nameRT], act)
         return act
 
-    def get_probDistribAct(self):
-        act_distrib = self.get_ssbgDistrib(ssbgToS=self.SSBGs[self.main_act])
-        #self.lastAct = act
-        return act_distrib
-
-    def get_ssbgDistrib(self, ssbgToS):  # , act=None):
-        # if act is None:
-        act_list = []
-        # act[ssbgToS.ID] = ssbgToS.sample()[0]
-
-        distrib_list = ssbgToS.get_prob_distrib()
-        # actToExplore = []
-        index_list = []
-        for distrib in distrib_list:
-            # actToExplore.append(np.random.choice(range(len(distrib)), p=distrib))
-            index_list.append(range(len(distrib)))
+    def get_probDistribAct(self, top_k=None):
+        # Joint list of (act, prob), only the top_k most probable acts if
+        # top_k is given
+        return self.act_distribution().top_k(top_k)
 
-        for actToExplore in itertools.product(*index_list):
+# class HierarchicalSSBG
+#########################################################
 
-            act_list_bis = self.get_subSsbgDistrib(ssbgToS, actToExplore)
-            actToExploreProb = np.product([dis[i] for dis, i in zip(distrib_list, actToExplore)])
+#########################################################
+#########################################################
+#########################################################
+# class ActDistribution
+
+
+class ActDistribution(object):
+
+    """\
+        Distribution of the next act of a HierarchicalSSBG, stored as one
+        distribution per action of each SSBG. The SSBG below a value is only
+        used when this value is chosen, the probability of an act is the
+        product of the probabilities of its values.
+    """
+
+    def __init__(self, hssbg):
+        # Names are the SSBG IDs, as in the acts of speSample
+        self.main_act = hssbg.SSBGs[hssbg.main_act].ID
+        self.distribs = {}
+        self.children = {}
+        for ssbg in hssbg.SSBGs.values():
+            self.distribs[ssbg.ID] = ssbg.get_act_distrib()
+            self.children[ssbg.ID] = [[param if hierar else None for param, hierar in zip(params, children)]
+                                   for params, children in zip(ssbg.param_values, ssbg.values_children)]
+
+    def sample(self, name=None, act=None):
+        name = name or self.main_act
+        if act is None:
+            act = {}
+        act[name] = [int(func.dissample(distrib)) for distrib in self.distribs[name]]
+        for children, val in zip(self.children[name], act[name]):
+            if children[val] is not None:
+                self.sample(children[val], act)
+        return act
 
-            act_list.extend([(act, p * actToExploreProb) for act, p in act_list_bis])
+    def prob(self, act):
+        # 0 for the acts with SSBGs that can not be used together
+        used = []
+        prob = self.sub_prob(self.main_act, act, used)
+        if set(used) != set(act.keys()):
+            return 0
+        return prob
+
+    def sub_prob(self, name, act, used):
+        if name not in act:
+            return 0
+        used.append(name)
+        prob = 1
+        for distrib, children, val in zip(self.distribs[name], self.children[name], act[name]):
+            prob *= distrib[val]
+            if children[val] is not None and prob > 0:
+                prob *= self.sub_prob(children[val], act, used)
+        return prob
+
+    def marginals(self):
+        # Probability that each SSBG is used and probability of each value of
+        # its actions. An SSBG reached by several values sums their probabilities.
+        used = {name: 0 for name in self.distribs.keys()}
+        used[self.main_act] = 1
+        for name in self.topological_order():
+            for distrib, children in zip(self.distribs[name], self.children[name]):
+                for val, child in enumerate(children):
+                    if child is not None:
+                        used[child] += used[name] * distrib[val]
+
+        return {name: {"used": used[name],
+                       "values": [used[name] * distrib for distrib in self.distribs[name]]}
+                for name in self.distribs.keys()}
+
+    def topological_order(self):
+        order = []
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            visited.add(name)
+            for children in self.children[name]:
+                for child in children:
+                    if child is not None:
+                        visit(child)
+            order.append(name)
+
+        visit(self.main_act)
+        return order[::-1]
+
+    def top_k(self, k=None, name=None):
+        # The k most probable acts of the sub graph of name, the best acts of
+        # a product only use the best acts of each factor
+        name = name or self.main_act
+        act_list = [({name: []}, 1)]
+        for distrib, children in zip(self.distribs[name], self.children[name]):
+            val_list = []
+            for val, p in enumerate(distrib):
+                if p == 0:
+                    continue
+                if children[val] is None:
+                    val_list.append(({}, val, p))
+                else:
+                    val_list.extend([(sub_act, val, p * sub_p) for sub_act, sub_p in self.top_k(k, children[val])])
+            val_list = self.best(val_list, k, key=lambda x: x[2])
+
+            new_act_list = []
+            for act, p in act_list:
+                for sub_act, val, sub_p in val_list:
+                    new_act = dict(sub_act)
+                    new_act.update(act)
+                    new_act[name] = act[name] + [val]
+                    new_act_list.append((new_act, p * sub_p))
+            act_list = self.best(new_act_list, k, key=lambda x: x[1])
 
         return act_list
 
-    def get_subSsbgDistrib(self, ssbgToS, actToExplore):
-        act_list_bis = [({ssbgToS.ID: actToExplore}, 1)]
-        for actRT in range(len(actToExplore)):
-            hierar = ssbgToS.values_children[actRT][actToExplore[actRT]]
-            if hierar:
-                new_act_list_bis = []
-                nameRT = ssbgToS.param_values[actRT][actToExplore[actRT]]
-                partial_act_list = self.get_ssbgDistrib(self.SSBGs[nameRT])
-
-                for partial_act, p in partial_act_list:
-                    tmp = copy.deepcopy(act_list_bis)
-                    for act, pbis in tmp:
-                        act.update(partial_act)
-                    tmp = [(act,p*pbis) for act, pbis in tmp]
-                    new_act_list_bis.extend(tmp)
-                act_list_bis = new_act_list_bis
-
-        return act_list_bis
-
+    @staticmethod
+    def best(data, k, key):
+        data = sorted(data, key=key, reverse=True)
+        if k is None:
+            return data
+        return data[:k]
 
-
-
-
-# class HierarchicalSSBG
+# class ActDistribution
 #########################################################
 
 #########################################################
@@ -200,6 +302,12 @@ class SSBanditGroup(object):
     def __repr__(self):
         return self.ID
 
+    def shared_data(self):
+        shared = [self.params, self.param_values, self.values_children, self.nvalue, self.nb_stay, self.h_actions, self.actions]
+        for ssb in self.SSB:
+            shared += ssb.shared_data()
+        return shared
+
     def getSuccess(self):
         successSSBG = []
         for i in range(len(self.SSB)):
@@ -266,6 +374,19 @@ class SSBanditGroup(object):
                 self.nbturn[i] = 0
         return self.act
 
+    def get_act_distrib(self):
+        # Distribution of the next sample of each action, the actions kept
+        # because of nb_stay have their current value
+        distribs = []
+        for i in range(self.nactions):
+            if self.nbturn[i] % self.nb_stay[i] == 0:
+                distribs.append(self.SSB[i].get_probDistrib())
+            else:
+                distrib = np.zeros(self.SSB[i].nval)
+                distrib[self.act[i]] = 1
+                distribs.append(distrib)
+        return distribs
+
     def get_prob_distrib(self):
         # TODO : old act to update distrib value depending of nbstay
 
@@ -314,6 +435,9 @@ class SSbandit(object):
         self.name = "ssb"
         return
 
+    def shared_data(self):
+        return [self.params, self.param_values]
+
     def getSuccess(self):
         return self.success
 
@@ -343,46 +467,16 @@ class SSbandit(object):
         return
 
     def random_sample(self):
-        nn = [1.0 / self.nval] * self.nval
-        return func.dissample(nn)
+        return func.rng().randint(self.nval)
 
     def get_probDistrib(self, exploration_coeff=10):
-        # if np.count_nonzero(self.bandval) == 1:
-        if self.bandval.count(0) == len(self.bandval) - 1:
-            for i in range(len(self.bandval)):
-                if self.bandval[i] != 0:
-                    self.bandval[i] = self.uniformval
-        #    self.bandval = self.bandval/sum(self.bandval) * self.uniformval
-        nn = np.array(self.bandval)
-        norm_v = sum(nn)
-        for i in range(0, len(nn)):
-            if nn[i] > 0:
-                nn[i] = nn[i] + norm_v / exploration_coeff
-
-        nb_0 = 0
-        for i in range(0, len(nn)):
-            if nn[i] == 0:  # < pow(10, -70):
-                nb_0 += 1
-
-        if nb_0 == len(nn):
-            nb0 = nb_0
-            # print self.name
-            # print "Prob : %s : %s " % (str(self.param_values), str(self.bandval))
-            # print self.success
-        #nn = exp(nn)-1
-        nn = nn / sum(nn)
-
-        """
-        nb_0 = 0
-        for i in range(0,len(nn)) :
-            if nn[i] < 1.0/(pow(10,50)) :
-                nb_0 += 1
-        if nb_0 == len(nn):
-            print "band : %s " % str(nn)
-        """
-        
-        return nn
-        # return [func.dissample(nn)]
+        if np.count_nonzero(self.bandval) == 1:
+            self.bandval[int(np.flatnonzero(self.bandval)[0])] = self.uniformval
+
+        bandval = np.asarray(self.bandval, dtype=float)
+        nn = np.where(bandval > 0, bandval + bandval.sum() / exploration_coeff, bandval)
+        return nn / nn.sum()
+
     def sample(self, exploration_coeff=10):
         return func.dissample(self.get_probDistrib(exploration_coeff))
 
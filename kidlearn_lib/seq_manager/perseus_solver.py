@@ -0,0 +1,114 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        perseus_solver
+# Purpose:     Perseus point based value iteration with batched backups
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+# References:
+# M. Spaan, N. Vlassis. Perseus: Randomized point-based value iteration for
+# POMDPs. In "Journal of Artificial Intelligence Research", vol. 24, pp.
+# 195-220, 2005.
+
+import numpy as np
+import scipy.sparse as sparse
+
+from .. import functions as func
+
+# Changed when the solver gives other policies, cached policies of the older
+# versions are not used (see policy_cache)
+SOLVER_VERSION = 1
+
+
+def alpha_projections(pomdp, V):
+    # G[a, z] = P[a] * diag(O[a][:, z]) * V.T, (nA, nZ, nS, nV)
+    G = []
+    for a in range(pomdp._nA):
+        G.append([pomdp._T.backward(a, pomdp._O[a][:, z, np.newaxis] * V.T) for z in range(pomdp._nZ)])
+    return np.array(G)
+
+
+def backup(pomdp, G, B):
+    # Backup of each belief of B (m, nS) : vector of the best action of each
+    # belief and its value
+    nA, nZ, nS, nV = G.shape
+    m = len(B)
+
+    # Best alpha vector for each (belief, action, observation)
+    scores = np.dot(B, G.transpose(2, 0, 1, 3).reshape(nS, -1)).reshape(m, nA, nZ, nV)
+    best = np.argmax(scores, axis=3)
+    G_best = G.transpose(0, 1, 3, 2)[np.arange(nA)[:, np.newaxis], np.arange(nZ), best]
+
+    g = pomdp._R.T[np.newaxis] + pomdp._gamma * G_best.sum(axis=2)
+    g_values = np.einsum("ij,iaj->ia", B, g)
+    act = np.argmax(g_values, axis=1)
+    rows = np.arange(m)
+    return g[rows, act], g_values[rows, act]
+
+
+def backup_stage(pomdp, V, D, batch_size=16):
+    # One Perseus stage : back up beliefs not improved yet until every belief
+    # of D has a value at least as high as with V
+    G = alpha_projections(pomdp, V)
+    vOld = np.dot(D, V.T)
+    kOld = np.argmax(vOld, axis=1)
+    vOld = vOld[np.arange(len(D)), kOld]
+
+    Vnew = []
+    known = set()
+    vNew = np.zeros(len(D), dtype=vOld.dtype)
+    vNew.fill(-np.inf)
+    improved = np.zeros(len(D), dtype=bool)
+    while not improved.all():
+        not_improved = np.flatnonzero(~improved)
+        idx = func.rng().choice(not_improved, min(batch_size, len(not_improved)), replace=False)
+        alphas, values = backup(pomdp, G, D[idx])
+
+        # Keep the previous vector of the belief if the backup is worse
+        worse = values < vOld[idx]
+        alphas[worse] = V[kOld[idx[worse]]]
+
+        new_alphas = []
+        for alpha in alphas:
+            key = alpha.tobytes()
+            if key not in known:
+                known.add(key)
+                new_alphas.append(alpha)
+        if len(new_alphas) > 0:
+            new_alphas = np.array(new_alphas)
+            Vnew.extend(new_alphas)
+            vNew = np.maximum(vNew, np.dot(D, new_alphas.T).max(axis=1))
+        # Sampled beliefs are done even if rounding puts them just below vOld
+        improved |= vNew >= vOld
+        improved[idx] = True
+
+    return np.array(Vnew), vNew, vOld
+
+
+def solve(pomdp, D=None, batch_size=16, max_iterr=3000, eps=1e-9, echo=1):
+    # Alpha vectors of the POMDP computed on the belief set D (nB, nS)
+    if D is None:
+        D = pomdp.belief_sample
+        if D is None:
+            D = pomdp.sampleBeliefs()
+    if sparse.issparse(D):
+        D = D.toarray()
+    D = np.asarray(D, dtype=pomdp._R.dtype)
+
+    V = np.ones((1, pomdp._nS), dtype=pomdp._R.dtype) * pomdp._R.min() / (1 - pomdp._gamma)
+    if echo:
+        print "Perseus"
+    for iterr in range(1, max_iterr + 1):
+        V, vNew, vOld = backup_stage(pomdp, V, D, batch_size)
+        Err = np.max(np.abs(vNew - vOld))
+        if Err < eps:
+            break
+    if echo:
+        print "iterr %s" % iterr
+        print "err %s" % Err
+
+    return np.matrix(V)
@@ -0,0 +1,66 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        policy_cache
+# Purpose:     Solved POMDP policies stored by a hash of their model
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import scipy.sparse as sparse
+
+from ..config import datafile
+from .perseus_solver import SOLVER_VERSION
+
+
+def policy_key(arrays, values):
+    # sha1 of the model arrays and of the json of the other values
+    h = hashlib.sha1()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr, dtype=float)
+        h.update(str(arr.shape))
+        h.update(arr.tobytes())
+    values = dict(values, solver_version=SOLVER_VERSION)
+    h.update(json.dumps(values, sort_keys=True))
+    return h.hexdigest()
+
+
+def policy_path(key, directory):
+    return datafile.buildpath("policy_{}.npz".format(key), directory)
+
+
+def load_policy(key, directory):
+    # Alpha vectors and belief set, None if the policy is not in the cache
+    filepath = policy_path(key, directory)
+    if not os.path.exists(filepath):
+        return None
+    data = np.load(filepath)
+    beliefs = sparse.csr_matrix((data["beliefs_data"], data["beliefs_indices"], data["beliefs_indptr"]),
+                                shape=tuple(data["beliefs_shape"]))
+    return np.matrix(data["alpha_v"]), beliefs
+
+
+def save_policy(key, directory, alpha_v, belief_sample):
+    filepath = policy_path(key, directory)
+    datafile.create_directories([filepath])
+    beliefs = sparse.csr_matrix(belief_sample)
+
+    # Written in a temporary file first, as datafile.save_file
+    temp = tempfile.NamedTemporaryFile(dir=os.path.dirname(filepath), delete=False)
+    np.savez_compressed(temp,
+                        alpha_v=np.asarray(alpha_v),
+                        beliefs_data=beliefs.data,
+                        beliefs_indices=beliefs.indices,
+                        beliefs_indptr=beliefs.indptr,
+                        beliefs_shape=np.array(beliefs.shape))
+    temp.close()
+    os.rename(temp.name, filepath)
+    return filepath
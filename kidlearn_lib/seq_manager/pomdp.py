@@ -14,10 +14,168 @@ import scipy.sparse as sparse
 
 from ..config import datafile
 from .. import functions as func
+from .perseus_solver import solve as perseus_solve, alpha_projections
+from . import policy_cache
+from .belief_tracker import belief_trackers
 
 # To compare with matlab code
 # np.random.seed(20)
 
+#########################################################
+#########################################################
+# class KTTransitions
+
+
+class KTTransitions(object):
+
+    """\
+        Transitions of a KT POMDP without building the (nA, nS, nS) matrices.
+        State s is the binary_repr of the learned KC, action a can only learn
+        KC a : s goes to s | mask[a] with probability p_learn[a, s] or stays.
+        Each row of a transition matrix has at most 2 non zero values.
+    """
+
+    def __init__(self, nA, p_transitions, trans_dep, dtype="float64"):
+        self.nA = nA
+        self.nS = pow(2, nA)
+        states = np.arange(self.nS)
+
+        # KC a is the bit a of binary_repr, starting from the left
+        self.masks = 1 << (nA - 1 - np.arange(nA))
+        self.learned = (states[:, np.newaxis] & self.masks) != 0
+
+        p_learn = np.dot(self.learned, np.transpose(trans_dep)) + p_transitions
+        p_learn[self.learned] = 0
+        self.p_learn = np.array(p_learn.T, dtype=dtype)
+        self.next_state = states | self.masks[:, np.newaxis]
+        self.unlearned = [np.flatnonzero(~self.learned[:, a]) for a in range(nA)]
+
+    def forward(self, a, B):
+        # B * P[a], on the last axis of the beliefs B
+        B = np.asarray(B)
+        unlearned = self.unlearned[a]
+        Bnew = B * (1 - self.p_learn[a])
+        Bnew[..., self.next_state[a, unlearned]] += B[..., unlearned] * self.p_learn[a, unlearned]
+        return Bnew
+
+    def backward(self, a, V):
+        # P[a] * V, on the first axis of V
+        V = np.asarray(V)
+        unlearned = self.unlearned[a]
+        p_learn = self.p_learn[a].reshape((-1,) + (1,) * (V.ndim - 1))
+        Vnew = (1 - p_learn) * V
+        Vnew[unlearned] += p_learn[unlearned] * V[self.next_state[a, unlearned]]
+        return Vnew
+
+    def sample(self, s, a):
+        if func.bernoulli(self.p_learn[a, s]):
+            return self.next_state[a, s]
+        return s
+
+    def sample_states(self, S, A):
+        learn = func.rng().random_sample(len(S)) < self.p_learn[A, S]
+        return np.where(learn, self.next_state[A, S], S)
+
+    def matrix(self, a):
+        unlearned = self.unlearned[a]
+        rows = np.concatenate([np.arange(self.nS), unlearned])
+        cols = np.concatenate([np.arange(self.nS), self.next_state[a, unlearned]])
+        vals = np.concatenate([1 - self.p_learn[a], self.p_learn[a, unlearned]]).astype(float)
+        return sparse.csr_matrix((vals, (rows, cols)), shape=(self.nS, self.nS))
+
+# class KTTransitions
+#########################################################
+
+#########################################################
+#########################################################
+# class DenseTransitions
+
+
+class DenseTransitions(object):
+
+    """\
+        Same interface as KTTransitions on (nA, nS, nS) matrices, used for
+        the manual models and the POMDP saved with dense matrices
+    """
+
+    def __init__(self, P):
+        self.P = P
+        self.nA = len(P)
+        self.nS = len(P[0])
+
+    def forward(self, a, B):
+        return np.dot(B, self.P[a])
+
+    def backward(self, a, V):
+        return np.dot(self.P[a], V)
+
+    def sample(self, s, a):
+        return func.dissample(self.P[a][s])
+
+    def sample_states(self, S, A):
+        return np.array([self.sample(s, a) for s, a in zip(S, A)])
+
+    def matrix(self, a):
+        return sparse.csr_matrix(np.array(self.P[a], dtype=float))
+
+# class DenseTransitions
+#########################################################
+
+#########################################################
+#########################################################
+# class BeliefSet
+
+
+class BeliefSet(object):
+
+    """\
+        Beliefs kept in a preallocated (nB, nS) buffer. A new belief is kept
+        if its squared distance to all the others is at least min_dist. The
+        beliefs are indexed by a few random projections : a belief closer
+        than sqrt(min_dist) is closer on every projection, so the distance
+        is only computed for the beliefs passing this filter.
+    """
+
+    def __init__(self, nB, nS, min_dist=1e-5, nb_proj=8):
+        self.beliefs = np.zeros((nB, nS))
+        self.size = 0
+        self.min_dist = min_dist
+        self.radius = np.sqrt(min_dist)
+
+        # Fixed projections, the simulation random state is not used
+        proj = np.random.RandomState(0).normal(size=(nS, nb_proj))
+        self._proj = proj / np.sqrt(np.sum(proj ** 2, axis=0))
+        self._keys = np.zeros((nB, nb_proj))
+
+    def __len__(self):
+        return self.size
+
+    def is_full(self):
+        return self.size == len(self.beliefs)
+
+    def is_new(self, b):
+        key = np.dot(b, self._proj)
+        close = np.all(np.abs(self._keys[:self.size] - key) < self.radius, axis=1)
+        candidates = self.beliefs[np.flatnonzero(close)]
+        return len(candidates) == 0 or np.min(np.sum((candidates - b) ** 2, axis=1)) >= self.min_dist
+
+    def add(self, b):
+        self.beliefs[self.size] = b
+        self._keys[self.size] = np.dot(b, self._proj)
+        self.size += 1
+
+    def add_if_new(self, b):
+        if self.is_new(b):
+            self.add(b)
+            return True
+        return False
+
+    def get_beliefs(self):
+        return sparse.csr_matrix(self.beliefs[:self.size])
+
+# class BeliefSet
+#########################################################
+
 
 class POMDP(object):
     #  POMDP* (POMDP Model: struct(nS     , nA       ,nZ, {P}, {O}, r, Gamma, s0, b0))
@@ -40,7 +198,7 @@ class POMDP(object):
     #                       s'         s           a     P(s'|s,a)
     #  nB*    (Number of belief points to be sampled)
 
-    def __init__(self, params=None, params_file="POMDP", directory="params_files", save_pomdp=0, load_p=None, manP=None, manO=None, usedMan=False):
+    def __init__(self, params=None, params_file="POMDP", directory="params_files", save_pomdp=0, load_p=None, manP=None, manO=None, usedMan=False, belief_sample=None):
         #self._Ps = 0.05
         #self._Pg = 0.05
         #
@@ -57,7 +215,7 @@ class POMDP(object):
         if load_p is not None:
             self.load(load_p)
         else:
-            params = params or func.load_json(params_file, directory)
+            params = params or func.load_json(params_file, directory, cached=True)
             self.params = params
             if "type_greedy" in params.keys():
                 self.type_greedy = params["type_greedy"]
@@ -65,6 +223,11 @@ class POMDP(object):
                 self.type_greedy = "arg_max"
 
             self._ref = "POMDP_{}".format(params["ref"])
+
+            # Precision of the Q-values computed at each step, the model is
+            # solved in float64 at least
+            self._precision = np.dtype(params.get("precision", "float64"))
+            self._dtype = np.promote_types(self._precision, np.float64)
             self.main_act = params["actions"]
             self._nA = params["n_Action"]
             self._n_StatePerAct = params["n_StatePerAct"]
@@ -90,36 +253,42 @@ class POMDP(object):
             self._s0[0] = 1
             self._AS = np.zeros(self._nS)
             self._AS[-1] = 1
-            self._R = np.array([np.zeros(self._nA) for x in range(self._nS)], dtype='float128')
-
-            self._P = np.array([[np.zeros(self._nS) for x in range(self._nS)]for x2 in range(self._nA)], dtype='float128')
-            self._O = np.array([[np.zeros(2) for x in range(self._nS)] for x2 in range(self._nA)], dtype='float128')
+            self._R = np.zeros((self._nS, self._nA), dtype=self._dtype)
 
             # baysian adding
             if manO is not None:
-                self.speP = np.array([[np.zeros(self._nS) for x in range(self._nS)]for x2 in range(self._nA)], dtype='float128')
-                self.speO = np.array([[np.zeros(2) for x in range(self._nS)] for x2 in range(self._nA)], dtype='float128')
+                self.speP = np.zeros((self._nA, self._nS, self._nS), dtype=self._dtype)
+                self.speO = np.zeros((self._nA, self._nS, self._nZ), dtype=self._dtype)
                 self.speManP = manP
                 self.speManO = manO
                 self.manMat_to_mat()
-            # else:
-            self.manP = np.array([[np.zeros(self._nS) for x in range(self._nA)]for x2 in range(self._nS)], dtype='float128')
-            self.manO = np.array([[np.zeros(2) for x in range(self._nA)] for x2 in range(self._nS)], dtype='float128')
 
             if usedMan and manO is not None:
-                self._P = self.speP
+                self._T = DenseTransitions(self.speP)
                 self._O = self.speO
             else:
                 self.construct_transDepend_pomdpKT()
 
-            self._nB = 1350
-            self.belief_sample = None
+            self._nB = params.get("n_Belief", 1350)
+            self._nStream = params.get("belief_streams", 1)
+            self.belief_sample = belief_sample
             self.alpha_v = None
 
+            # Belief followed between the steps, "factored" keeps only the
+            # probability of each KC
+            self.belief_tracker = belief_trackers[params.get("belief_tracker", "exact")](self)
             self.init_traj()
 
-            self.sampleBeliefs()
-            self.perseus_alpha_vect()
+            # Policy solved for the same model is read in the policy_cache
+            # directory when one is given, the cache is not used for a given
+            # belief sample
+            self.policy_cache = params.get("policy_cache")
+            if belief_sample is not None:
+                self.perseus_alpha_vect()
+            elif not self.load_cached_policy():
+                self.sampleBeliefs()
+                self.perseus_alpha_vect()
+                self.save_cached_policy()
 
             if save_pomdp:
                 self.save()
@@ -152,53 +321,22 @@ class POMDP(object):
                 for iss in range(len(self.speManP[ii][aa])):
                     self.speP[aa][ii][iss] = self.speManP[ii][aa][iss]
 
-    def construct_transDepend_pomdpKT(self):
-        for ii in range(0, self._nS):
-            str_ss = np.binary_repr(ii, self._nA)
-            ss = np.array([int(x) for x in str_ss])
-            for aa in range(self._nA):
-                nss = copy.copy(ss)
-                self._R[ii] = [sum(ss)]  # *self._nA
-                if ss[aa] == 1:
-                    iss = int(str_ss, 2)
-                    # no forgetting
-                    self._P[aa][ii][iss] = 1
-                    self.manP[ii][aa][iss] = 1
-                    self._O[aa][ii] = [1 - self._Ps, self._Ps]
-                    self.manO[ii][aa] = [1 - self._Ps, self._Ps]
-                else:
-                    nss[aa] = 1
-                    iss = int(''.join([str(x) for x in nss]), 2)
-                    aux = np.dot(ss, self._trans_dep[aa, :]) + self._Pt[aa]
-                    self._P[aa][ii][iss] = aux
-                    self.manP[ii][aa][iss] = aux
+    def construct_transDepend_pomdpKT(self, p_transitions=None):
+        if p_transitions is None:
+            p_transitions = self._Pt
+        self._T = KTTransitions(self._nA, p_transitions, self._trans_dep, self._dtype)
 
-                    self._P[aa][ii][ii] = 1 - aux
-                    self.manP[ii][aa][ii] = 1 - aux
+        # Reward : number of KC learned, the same for each action
+        learned = self._T.learned
+        self._R = np.array(np.repeat(learned.sum(axis=1)[:, np.newaxis], self._nA, axis=1), dtype=self._dtype)
 
-                    self._O[aa][ii] = [self._Pg, 1 - self._Pg]
-                    self.manO[ii][aa] = [self._Pg, 1 - self._Pg]
+        # Observation : 0 is the right answer
+        self._O = np.zeros((self._nA, self._nS, self._nZ), dtype=self._dtype)
+        self._O[learned.T] = [1 - self._Ps, self._Ps]
+        self._O[~learned.T] = [self._Pg, 1 - self._Pg]
 
     def construct_basic_pomdpKT(self):
-
-        for ii in range(0, self._nS):
-            str_ss = np.binary_repr(ii, self._nA)
-            ss = np.array([int(x) for x in str_ss])
-            for aa in range(self._nA):
-                nss = copy.copy(ss)
-                self._R[ii] = [sum(ss)] * self._nA
-                if ss[aa] == 1:
-                    iss = int(str_ss, 2)
-                    # no forgetting
-                    self._P[aa][ii][iss] = 1
-                    self._O[aa][ii] = [1 - self._Ps, self._Ps]
-                else:
-                    nss[aa] = 1
-                    iss = int(''.join([str(x) for x in nss]), 2)
-                    aux = np.dot(ss, self._trans_dep[aa, :][np.newaxis].T) + self._Pt[aa, aa]
-                    self._P[aa][ii][iss] = aux
-                    self._P[aa][ii][ii] = 1 - aux
-                    self._O[aa][ii] = [self._Pg, 1 - self._Pg]
+        self.construct_transDepend_pomdpKT(np.diag(self._Pt))
 
     # Observation and transition matrice constructions
     ####################################################
@@ -228,23 +366,49 @@ class POMDP(object):
         for key, val in pomdp.__dict__.items():
             object.__setattr__(self, key, val)
 
+        # POMDP saved with the dense float128 matrices
+        if not hasattr(self, "_T"):
+            self._T = DenseTransitions(self._P)
+            self._dtype = self._P.dtype
+        if not hasattr(self, "_precision"):
+            self._precision = np.dtype("float64")
+        # The tracker is rebuilt on this object, not on the loaded one
+        self.belief_tracker = belief_trackers[self.params.get("belief_tracker", "exact")](self)
+
         if "action" in self.params.keys():
             self.main_act = self.params["action"]
 
     def get_KC(self):
         return self._KC
 
+    # Clones share the model, the policy and the belief sample, only the
+    # current belief is copied
+    def shared_data(self):
+        if self.alpha_v is not None:
+            self.get_alpha_projections()
+        return [val for key, val in self.__dict__.items() if key != "current_belief"]
+
+    def clone(self):
+        return func.clone(self, self.shared_data())
+
+    def fresh_state(self):
+        # Clone at the beginning of a session
+        seq = self.clone()
+        seq.init_traj()
+        return seq
+
     def get_state(self):
         state = {}
         state["belief"] = "self.current_belief"
 
         return state
 
-    def sampleBeliefs(self, nB=None):
+    def sampleBeliefs(self, nB=None, n_streams=None):
 
         # Input (inputs marked with * are mandatory):
         # . POMDP* (POMDP Model: struct(nS, nA, nZ, {P}, {O}, r, gamma, s0, b0))
         # . nB*    (Number of belief points to be sampled)
+        # . n_streams (Number of trajectories simulated together)
         #
         # Output (outputs marked with * are mandatory):
         # . D (Data-set containing nB beliefs)
@@ -256,69 +420,57 @@ class POMDP(object):
         print "Sample Beliefs"
 
         nB = nB or self._nB
+        n_streams = n_streams or getattr(self, "_nStream", 1)
 
-        S = self.initS()
-
-        # Initialize belief
+        # Initialize beliefs and belief dataset
 
+        uniform = np.ones((self._nS)) / self._nS
         if hasattr(self, '_s0'):
             b = self._s0
         else:
-            b = np.ones((0, self._nS)) / self._nS
+            b = uniform
 
-        # Initialize belief dataset
+        D = BeliefSet(nB, self._nS)
+        D.add(b)
 
-        #D = np.zeros((nB,self._nS))
-        D = sparse.csr_matrix((nB, self._nS))
-        D[0, :] = b
+        S = np.array([self.initS() for x in range(n_streams)])
+        B = np.repeat(np.array(b, dtype=float)[np.newaxis], n_streams, axis=0)
 
-        i = 1
         k = 0
+        while not D.is_full() and k < 100 * n_streams:
 
-        while i <= nB and k < 100:
+            # Sample actions and simulate transitions
 
-            # print i,k
+            A = func.rng().randint(self._nA, size=n_streams)
+            S, Rnew, Znew, B = self.step_batch(S, A, B)
 
-            # Sample action
-            A = np.ceil((self._nA) * np.random.rand()) - 1
+            for i in range(n_streams):
+                if self._AS[S[i]] == 1:
+                    B[i] = uniform
+                    S[i] = self.initS()
 
-        # Simulate transition
+                # Compute distance to existing beliefs
 
-            S, Rnew, Znew, Bnew = self.step(S, A, b)
-
-            if self._AS[S] == 1:
-                b = np.ones((self._nS)) / self._nS
-                S = self.initS()
-            else:
-                b = Bnew
-
-            # Compute distance to exis
-            Dist = np.sum(np.power(npmat.repmat(b, i, 1) - D[0:i, :], 2), axis=1)
-
-            # if np.min(Dist) >= 1e-5 :
-            if np.matrix.min(Dist) >= 1e-5:
-                i = i + 1
-                k = 0
-                D[i - 1, :] = b
-            else:
-                k = k + 1
-                S = self.initS()
-                b = np.ones((self._nS)) / self._nS
-
-        D = D[0:i, :]
+                if D.is_full():
+                    break
+                elif D.add_if_new(B[i]):
+                    k = 0
+                else:
+                    k = k + 1
+                    S[i] = self.initS()
+                    B[i] = uniform
 
-        self.belief_sample = D
+        self.belief_sample = D.get_beliefs()
 
-        return D
+        return self.belief_sample
 
     def initS(self):
         if hasattr(self, '_s0'):
             S = self._s0
             if len(S) > 1:
-                TMP = np.cumsum(S)
-                S = np.where(TMP >= np.random.rand())[0][0]
+                S = func.dissample(S)
         else:
-            S = np.ceil(self._nS * np.random.rand()) - 1
+            S = func.rng().randint(self._nS)
 
         return S
 
@@ -340,29 +492,17 @@ class POMDP(object):
         # Init parameters:
         #
         # . None
-        T = self._P[A]
-        O = self._O[A]
-
         # Compute reward
 
         Rnew = self._R[S, A]
 
         # Simulate new state
 
-        tmp = np.cumsum(T[S, :])
-        r = np.random.rand()
-        # print "T[s] {}".format(T[S, :])
-        # print "tmps {}".format(tmp)
-        # print "r {}".format(r)
-        # print np.where(tmp >= r)
-        # print np.where(tmp >= r)[0]
-        # raw_input()
-        Snew = np.where(tmp >= r)[0][0]
+        Snew = self._T.sample(S, A)
 
         # Simulate new observation
 
-        tmp = np.cumsum(O[Snew, :])
-        Znew = np.where(tmp >= np.random.rand())[0][0]
+        Znew = func.dissample(self._O[A][Snew, :])
 
         # Update belief
 
@@ -371,15 +511,32 @@ class POMDP(object):
 
         return Snew, Rnew, Znew, Bnew
 
+    def step_batch(self, S, A, B):
+        # step for arrays of states, actions and beliefs (one row per
+        # trajectory)
+        Rnew = self._R[S, A]
+        Snew = self._T.sample_states(S, A)
+
+        Znew = func.dissample_rows(self._O[A, Snew])
+
+        Bnew = np.zeros(B.shape)
+        for a in np.unique(A):
+            rows = np.flatnonzero(A == a)
+            Bnew[rows] = self.blfUpdt_batch(B[rows], a, Znew[rows])
+
+        return Snew, Rnew, Znew, Bnew
+
     def reward(self, state, action):
         return self._R[state, action]
 
+    def get_transition_matrix(self, A):
+        return self._T.matrix(A)
+
     def blfUpdt(self, B, A, Z):
-        T = self._P[A]
         O = self._O[A][:, Z]
 
         # Update belief
-        Bnew = np.dot(B, T) * O.T
+        Bnew = self._T.forward(A, B) * O
 
         if sum(Bnew) == 0:
             Bnew = O.T
@@ -388,6 +545,15 @@ class POMDP(object):
 
         return Bnew
 
+    def blfUpdt_batch(self, B, A, Z):
+        # blfUpdt of each row of B with action A and observations Z
+        O = self._O[A][:, Z].T
+        Bnew = self._T.forward(A, B) * O
+
+        norm = Bnew.sum(axis=1)
+        Bnew[norm == 0] = O[norm == 0]
+        return Bnew / Bnew.sum(axis=1)[:, np.newaxis]
+
     def traj(self, b0=None, s0=0, nsteps=10):
         b = b0  # or self._s0
         S = s0
@@ -396,7 +562,7 @@ class POMDP(object):
             a = self.sample(b)
             if isinstance(a, int):
                 a = [a]
-            a = a[np.random.randint(len(a))]
+            a = a[func.rng().randint(len(a))]
             [S, R, Z, b] = self.step(S, a, b)  # we should not know the true state, check if code allows that
             D.append([S, R, Z, a])
             # print D
@@ -407,7 +573,7 @@ class POMDP(object):
     # Expe code adaptation
 
     def init_traj(self):
-        self.current_belief = self._s0
+        self.current_belief = self.belief_tracker.initial()
 
     def compute_act_lvl(self, act, RT=None, **kwargs):
         lvl = [0] * self._nA
@@ -418,48 +584,79 @@ class POMDP(object):
         act = act[self.main_act][0]
         result = 1 - result
 
-        self.current_belief = self.blfUpdt(self.current_belief, act, result)
+        self.current_belief = self.belief_tracker.update(self.current_belief, act, result)
 
     def sample(self, b=None, isQMDP=False):
         if b is None:
-            b = self.current_belief
+            b = self.belief_tracker.belief(self.current_belief)
 
-        V = self.alpha_v
-        b = np.matrix(b)
         # If Q-MDP choose action directly
         if isQMDP:
-            Q = V * b.T
+            Q = self.alpha_v * np.matrix(b).T
             act = greedy('samp', Q)
 
-        # else: Build Q-matrix
+        # else: Q-values of the belief
         else:
-            Q = np.zeros(self._nA)
-            for a in range(self._nA):
-                #b = np.matrix(b)
-
-                # Compute updated beliefs for current action and all observations
-                # print"b : {}".format(b)
-                Vaux = (b * self._P[a]).T
-
-                Vaux = np.multiply(npmat.repmat(Vaux, 1, self._nZ), self._O[a])
-                Vaux = V * Vaux
-
-                Vmax = np.amax(Vaux, 0)[0]
-
-                # Compute observation probabilities and multiply
-
-                Q[a] = (b * np.matrix(self._R[:, a]).T).item(0, 0) + self._gamma * np.sum(Vmax)
-            # print "Q : {}".format(Q)
-            # raw_input()
-            act = greedy('prob', Q)
+            act = greedy('prob', self.q_values(b)[0])
 
         f_act = {self.main_act: [act]}
 
         return f_act
 
+    def policy_key(self):
+        # Manual models are not cached
+        if not isinstance(self._T, KTTransitions):
+            return None
+        values = {"p_guess": self._Pg,
+                  "p_slip": self._Ps,
+                  "gamma": self._gamma,
+                  "n_StatePerAct": self._n_StatePerAct,
+                  "nB": self._nB,
+                  "belief_streams": self._nStream,
+                  "perseus_batch": self.params.get("perseus_batch", 16),
+                  "dtype": self._dtype.name}
+        return policy_cache.policy_key([self._Pt, self._trans_dep], values)
+
+    def load_cached_policy(self):
+        key = self.policy_key()
+        if not self.policy_cache or key is None:
+            return False
+        policy = policy_cache.load_policy(key, self.policy_cache)
+        if policy is None:
+            return False
+        self.alpha_v, self.belief_sample = policy
+        return True
+
+    def save_cached_policy(self):
+        key = self.policy_key()
+        if not self.policy_cache or key is None:
+            return
+        policy_cache.save_policy(key, self.policy_cache, self.alpha_v, self.belief_sample)
+
+    def sample_batch(self, B, random_states=None):
+        # One action for each belief of B (m, nS), random_states : stream of
+        # each belief (see func.random_sample_rows)
+        return func.dissample_rows(softmax_rows(self.q_values(B)), random_states)
+
+    def get_alpha_projections(self):
+        # P[a] * diag(O[a][:, z]) * alpha_v.T stacked in (nS, nA * nZ * nV),
+        # computed once for each set of alpha vectors
+        if getattr(self, "_G_alpha", None) is not self.alpha_v:
+            G = alpha_projections(self, np.asarray(self.alpha_v))
+            self._G = G.transpose(2, 0, 1, 3).reshape(self._nS, -1).astype(self._precision)
+            self._G_alpha = self.alpha_v
+        return self._G
+
+    def q_values(self, B):
+        # Q-values (m, nA) of the beliefs B (m, nS) : reward and best alpha
+        # vector after each observation
+        B = np.atleast_2d(np.asarray(B, dtype=self._precision))
+        scores = np.dot(B, self.get_alpha_projections()).reshape(len(B), self._nA, self._nZ, -1)
+        return np.dot(B, self._R.astype(self._precision)) + self._gamma * scores.max(axis=3).sum(axis=2)
+
     def perseus_alpha_vect(self):
-        alpha_v = perseus(self)
-        self.alpha_v = alpha_v
+        self.alpha_v = perseus_solve(self, batch_size=self.params.get("perseus_batch", 16))
+
 
 #########################################################################################
 ###### PERSEUS ##########################################################################
@@ -477,6 +674,15 @@ def softmax(w, t=0.10):
         return [1.0 / len(w)] * len(w)
 
 
+def softmax_rows(W, t=0.10):
+    # softmax of each row of W
+    W = W - W.min(axis=1)[:, np.newaxis]
+    span = W.max(axis=1)
+    W = W / np.where(span > 0, span, 1)[:, np.newaxis]
+    e = np.exp(W / t)
+    return e / e.sum(axis=1)[:, np.newaxis]
+
+
 def greedy(mode, U):
     # print U
     # print np.shape(U)
@@ -491,10 +697,7 @@ def greedy(mode, U):
         Idx = np.argwhere(U == np.amax(U, axis=0)).flatten().tolist()
 
         if mode == 'samp':
-            # print Idx
-            # print len(Idx) * np.random.rand()
-            # print np.ceil(len(Idx) * np.random.rand())
-            a = Idx[np.ceil(len(Idx) * np.random.rand())]
+            a = Idx[func.rng().randint(len(Idx))]
         elif mode == 'prob':
             a = Idx
 
@@ -635,7 +838,7 @@ def perseusBackup(pomdp, V, D):
         nV = np.size(V, 0)
         # 2a) Sample belief from Dqueue
 
-        tmp = int(np.ceil(nB * np.random.rand()) - 1)
+        tmp = func.rng().randint(nB)
         b = Dqueue[tmp, :]
         indTable = range(tmp) + range(tmp + 1, nB)
         try:
@@ -650,7 +853,7 @@ def perseusBackup(pomdp, V, D):
 
             # Compute updated beliefs for current action and all observations
 
-            bnew = (b * pomdp._P[a]).T
+            bnew = np.matrix(pomdp._T.forward(a, b.toarray())).T
 
             bnew = np.multiply(npmat.repmat(bnew, 1, pomdp._nZ), pomdp._O[a])
 
@@ -672,9 +875,8 @@ def perseusBackup(pomdp, V, D):
             # print "OxVupd %s" % OxVupd
             # raw_input()
             # print np.matrix(pomdp._R[:, a]).T.shape
-            # print np.asarray(np.matrix(pomdp._R[:, a]).T + pomdp._gamma * pomdp._P[a] * OxVupd)[:,0]
             # print g[:, a]
-            g[:, a] = np.asarray(np.matrix(pomdp._R[:, a]).T + pomdp._gamma * pomdp._P[a] * OxVupd)[:, 0]
+            g[:, a] = pomdp._R[:, a] + pomdp._gamma * pomdp._T.backward(a, np.asarray(OxVupd))[:, 0]
             # print "g shape %s" % str(g.shape)
 
         # To make g and V same dimensional
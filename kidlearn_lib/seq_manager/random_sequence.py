@@ -22,7 +22,7 @@ from .. import functions as func
 class RandomSequence(ZpdesHssbg):
 
     def __init__(self, params=None, params_file="seq_test_1", directory="params_files"):
-        params = params or func.load_json(params_file,directory)
+        params = params or func.load_json(params_file,directory,cached=True)
         if "zpdes" in params.keys():
             ZpdesHssbg.__init__(self, params_file=params["zpdes"]["file"],directory = params["zpdes"]["path"])
         else:
@@ -33,9 +33,12 @@ class RandomSequence(ZpdesHssbg):
             self.generate_acts(**params["seq_path"])
             self.calcul_all_Ex_lvl()
 
+    def shared_data(self):
+        return ZpdesHssbg.shared_data(self) + [getattr(self, "acts", None), getattr(self, "all_lvl", None)]
+
     def sample(self, nb_stay=0):
         if self.random_type == 0:
-            return  self.acts[np.random.randint(0,len(self.acts))]
+            return  self.acts[func.rng().randint(0,len(self.acts))]
 
         elif self.random_type == 1:
             return self.choose_lvl_random_ex()
@@ -66,8 +69,7 @@ class RandomSequence(ZpdesHssbg):
         def calDist(val1,val2):
             return abs(val2 - val1)
 
-        r = random.randint(0,100)
-        r = 1.0*r/100
+        r = func.rng().randint(0,101) / 100.0
         newDic = copy.deepcopy(self.all_lvl)
         
         while len(newDic) > 3:
@@ -88,7 +90,7 @@ class RandomSequence(ZpdesHssbg):
         self.all_lvl = sorted(all_lvl.items(), key=operator.itemgetter(1))
 
     def generate_acts(self, params=None, params_file="expe_seq", directory="sequence_def"):
-        params = params or func.load_json(params_file,directory)
+        params = params or func.load_json(params_file,directory,cached=True)
         self.acts = []
         for act_groups  in params["activity"]:
             for act in act_groups:
@@ -11,6 +11,7 @@
 #-------------------------------------------------------------------------------
 
 import os
+import json
 import numpy as np
 
 from .hssbg import HierarchicalSSBG, SSBanditGroup, SSbandit
@@ -26,7 +27,7 @@ class RiaritHssbg(HierarchicalSSBG):
     def __init__(self, params=None, params_file="seq_test_1", directory="params_files"):
         # params : RT, path
 
-        params = params or func.load_json(params_file, directory)
+        params = params or func.load_json(params_file, directory, cached=True)
         self.current_lvl_ex = {}
         if "RT" in params.keys():
             params["graph"] = params["RT"]
@@ -34,6 +35,15 @@ class RiaritHssbg(HierarchicalSSBG):
         self.load_Error()
         # self.CreateHSSBG(RT)
 
+    def shared_data(self):
+        return HierarchicalSSBG.shared_data(self) + [self.error_tab, self.error_ID_tab]
+
+    def fresh_state(self):
+        seq = HierarchicalSSBG.fresh_state(self)
+        for ssbg in seq.SSBGs.values():
+            ssbg.estim_level = np.zeros(ssbg.ncompetencies)
+        return seq
+
     # Accesser
     def get_KC(self):
         return self.SSBGs[self.main_act].competencies
@@ -126,13 +136,9 @@ class RiaritHssbg(HierarchicalSSBG):
         self.error_ID_tab = []
         file_to_read = "%serror_%s%s" % (directory, RT_ID, ".txt")
         try:
-            reader = open(file_to_read, 'rb')
-            lines = reader.readlines()
-            for lin in lines[2:]:
-                tmp = func.spe_split('\s(\d*\.\d*|\d+)|\s([a-zA-Z0-9_]*)', lin)
-                aux = [float(x) for x in tmp[2:len(tmp)]]
-                self.error_ID_tab.append(tmp[1])
-                self.error_tab.append(aux[0:self.ncompetencies])
+            error_ID_tab, error_tab = func.load_file_cached(file_to_read, read_error_table)
+            self.error_ID_tab = list(error_ID_tab)
+            self.error_tab = [aux[0:self.ncompetencies] for aux in error_tab]
         except:
             return
         return
@@ -168,7 +174,12 @@ class RiaritSsbg(SSBanditGroup):
     def instanciate_ssb(self, ii, is_hierarchical):
         params = self.params["RiaritSsb"]
 
-        return RiaritSsb(ii, self.nvalue[ii], self.ncompetencies, self.requer[ii], self.stop[ii], is_hierarchical=is_hierarchical, param_values=self.param_values[ii], params=params)
+        values = slice(self.offsets[ii], self.offsets[ii] + self.nvalue[ii])
+        return RiaritSsb(ii, self.nvalue[ii], self.ncompetencies, self.requir_table[values], self.deacti_table[values], is_hierarchical=is_hierarchical, param_values=self.param_values[ii], params=params)
+
+    def shared_data(self):
+        return SSBanditGroup.shared_data(self) + [self.competencies, self.RT, self.requer, self.stop, self.offsets,
+                                                  self.impact_table, self.requir_table, self.deacti_table]
 
     def get_estim_level(self, **kwargs):
         if "dict_form" in kwargs.keys():
@@ -176,32 +187,149 @@ class RiaritSsbg(SSBanditGroup):
         return self.estim_level
 
     def setLevel(self, level):
-        self.estim_level = level
+        self.estim_level = np.array(level, dtype=float)
 
     def calDiffLvl(self, lvl):
-        lvlDiff = []
-        for i in range(self.ncompetencies):
-            lvlDiff.append(lvl[i] - self.estim_level[i])
-        return lvlDiff
+        return list(np.asarray(lvl) - self.estim_level)
 
     def loadRT(self, RT):
-        if os.path.exists(os.path.join(RT["path"], RT["file_name"] + ".json")):
-            self.load_jsonRT(RT)
-        else:
-            self.load_textRT(RT)
+        # The table is shared with the other RiaritSsbg of the same file, the
+        # state of the SSBG is its own
+        table = load_table(RT)
+        self.__dict__.update(table.__dict__)
+        self.estim_level = np.zeros(self.ncompetencies)
+        self.act = [0] * self.nactions
+        self.nbturn = [0] * self.nactions
         self.CreateSSBs()
 
-    def load_jsonRT(self, RT):
-        self.ID = RT["file_name"]
-        params_RT = func.load_json(RT["file_name"], RT["path"])
+    def RTable(self, act, lvl=None, **kwargs):
+        # from the solution and the RTable it will compute the level it will compute the progress and provide a reward to the SSB
+        # wrong assuming always right, debugging
+
+        # act can also be a (N, nactions) array of acts, lvl is then (N, nKC)
+        act = np.asarray(act)
+        impact = np.prod(self.impact_table[self.offsets + act[..., :self.nactions]], axis=-2)
+        lvl = impact if lvl is None else impact * lvl
+
+        # if "dict_form" in kwargs.keys():
+        #    lvl_dict = {key: value for (key,value) in zip(self.competencies,lvl)}
+        #    return lvl_dict
+
+        return lvl
+
+    def calcul_reward(self, lvl, result, answer_impact):
+        # Progress on a right KC (impact 1) or regress on a wrong one (0)
+        diff = lvl - self.estim_level
+        r_KC = diff * (np.sign(diff) == np.multiply(answer_impact, 2) - 1)
+
+        self.estim_level = self.estim_level + self.levelupdate * r_KC
+        r = max(0, r_KC.sum() / self.ncompetencies)
+        return r
+
+    def update(self, lvl, act, result, answer_impact, *args, **kwargs):
+        r_KC = self.calcul_reward(lvl, result, answer_impact)
+        success = np.mean(answer_impact)
+
+        for ii in range(self.nactions):
+            # update the value of each bandit
+            self.SSB[ii].success[act[ii]].append(success)
+            self.nbturn[ii] += 1
+            self.SSB[ii].update(act[ii], r_KC)
+            self.SSB[ii].promote(self.estim_level)
+
+
+# class RiaritSsbg
+#########################################################
+
+#########################################################
+#########################################################
+# class RiaritSsb
+
+class RiaritSsb(SSbandit):
+
+    def __init__(self, id, nval, nKC, requer, stop, is_hierarchical=0, param_values=[], params={}):
+        # params :
+
+        SSbandit.__init__(self, id, nval, is_hierarchical, param_values, params=params)
+        #self.name = "rssb"
+        # (nval, nKC) rows of the requir and deacti tables of the SSBG
+        self.requer = np.asarray(requer, dtype=float)
+        self.stop = np.asarray(stop, dtype=float)
+        init_level = [0.0] * nKC
+        self.promote(init_level, True)
+
+    def shared_data(self):
+        return SSbandit.shared_data(self) + [self.requer, self.stop]
+
+    def promote(self, lvl, init=False):
+        lvl = np.asarray(lvl)
+        above_stop = lvl > self.stop
+        activate = (lvl >= self.requer).all(axis=1) & ~above_stop.all(axis=1)
+        deactivate = above_stop.all(axis=1)
+
+        # A value activated takes the max of the values at its turn, after
+        # the deactivation of the values before it
+        for ii in np.flatnonzero(activate):
+            if self.bandval[ii] == 0:
+                if init == True:
+                    self.bandval[ii] = self.uniformval
+                else:
+                    for jj in np.flatnonzero(deactivate[:ii]):
+                        self.bandval[jj] = 0
+                    self.bandval[ii] = max(self.bandval)
+
+        for ii in np.flatnonzero(deactivate):
+            self.bandval[ii] = 0
+
+        return
+
+# class RiaritSsb
+#########################################################
+
+#########################################################
+#########################################################
+# class RiaritTable
+
+
+class RiaritTable(object):
+
+    """\
+        Definition of a RiARiT table, read from a .json, a .txt or a compiled
+        .npz file. The .npz is read first when it exists, it has to be written
+        again with save_table after an edit of the table.
+    """
+
+    # Definition lists saved in the .npz beside the compiled tables
+    definition = ["competencies", "ncompetencies", "actions", "nactions", "h_actions", "nb_stay",
+                  "RT", "requer", "stop", "param_values", "values_children", "nvalue"]
+
+    def __init__(self, path_RT):
+        self.ID = os.path.basename(path_RT).split(".")[0]
+        extension = os.path.splitext(path_RT)[1]
+        if extension == ".npz":
+            self.load_npz(path_RT)
+        else:
+            if extension == ".json":
+                self.load_json(path_RT)
+            else:
+                self.load_text(path_RT)
+            self.compile()
+
+    def compile(self):
+        # Values of all the actions stacked in (sum(nvalue), ncompetencies)
+        # tables, value v of action ii is the row offsets[ii] + v
+        self.offsets = np.concatenate(([0], np.cumsum(self.nvalue)[:-1])).astype(int)
+        self.impact_table = np.ascontiguousarray([val for vals in self.RT for val in vals], dtype=float)
+        self.requir_table = np.ascontiguousarray([val for vals in self.requer for val in vals], dtype=float)
+        self.deacti_table = np.ascontiguousarray([val for vals in self.stop for val in vals], dtype=float)
+
+    def load_json(self, path_RT):
+        params_RT = func.read_json(path_RT)
         self.competencies = params_RT["competencies"]
         self.ncompetencies = len(self.competencies)
-        self.estim_level = [0] * self.ncompetencies
         self.actions = params_RT["actions"]
         self.nactions = len(self.actions)
-        self.act = [0] * self.nactions
         self.h_actions = [0] * self.nactions
-        self.nbturn = [0] * self.nactions
         self.nb_stay = func.fill_data(params_RT["nb_stay"], self.nactions)
         #self.nb_stay = params_RT["nb_stay"] + [params_RT["nb_stay"][-1]]*(self.nactions-(len(params_RT["nb_stay"])-1))
         self.RT = [[] for i in range(self.nactions)]
@@ -223,24 +351,17 @@ class RiaritSsbg(SSBanditGroup):
                 self.stop[num_act].append(func.fill_data(val["deacti"], self.ncompetencies))
             self.nvalue.append(len(self.param_values[num_act]))
 
-    def load_textRT(self, RT):
-        path_RT = os.path.join(RT["path"], RT["file_name"]) + ".txt"
+    def load_text(self, path_RT):
         reader = open(path_RT, 'rb')
-        self.ID = ((path_RT.split("/")[-1]).split(".")[0])
-        #self.ID = ((path_RT.split("/")[-1]).split(".")[0]).split("_")[1]
-        # print "SSB CREATE: %s" % self.ID
         lines = reader.readlines()
         tmp = func.spe_split('\W', lines[0])
         self.competencies = tmp[1:len(tmp)]
         self.ncompetencies = len(self.competencies)
-        self.estim_level = [0] * self.ncompetencies
 
         tmp = func.spe_split('\W', lines[1])
         self.actions = tmp[1:len(tmp)]
         self.nactions = len(self.actions)
-        self.act = [0] * self.nactions
         self.h_actions = [int(x[-1] == "H") for x in self.actions]
-        self.nbturn = [0] * self.nactions
 
         tmp = func.spe_split('\W', lines[2])
         self.nb_stay = [int(x) for x in tmp[1:len(tmp)]] + [int(x)] * (self.nactions - (len(tmp) - 1))
@@ -271,77 +392,55 @@ class RiaritSsbg(SSBanditGroup):
         self.nvalue.append(nval)
         reader.close()
 
-    def RTable(self, act, lvl=None, **kwargs):
-        # from the solution and the RTable it will compute the level it will compute the progress and provide a reward to the SSB
-        # wrong assuming always right, debugging
-
-        if lvl is None:
-            lvl = [1] * self.ncompetencies
-        for ii in range(self.nactions):
-            lvl = [a * b for a, b in zip(lvl, self.RT[ii][act[ii]])]
-
-        # if "dict_form" in kwargs.keys():
-        #    lvl_dict = {key: value for (key,value) in zip(self.competencies,lvl)}
-        #    return lvl_dict
-
-        return lvl
-
-    def calcul_reward(self, lvl, result, answer_impact):
-        r_KC = [0] * self.ncompetencies
-        for i in range(self.ncompetencies):
-            diff = lvl[i] - self.estim_level[i]
-            if (diff > 0 and answer_impact[i] == 1) or (diff < 0 and answer_impact[i] == 0):
-                r_KC[i] = diff
-
-        for i in range(self.ncompetencies):
-            self.estim_level[i] = self.estim_level[i] + self.levelupdate * r_KC[i]
-        r = max(0, sum(r_KC) / self.ncompetencies)
-        return r
-
-    def update(self, lvl, act, result, answer_impact, *args, **kwargs):
-        r_KC = self.calcul_reward(lvl, result, answer_impact)
-
-        for ii in range(self.nactions):
-            # update the value of each bandit
-            self.SSB[ii].success[act[ii]].append(np.mean(answer_impact))
-            self.nbturn[ii] += 1
-            self.SSB[ii].update(act[ii], r_KC)
-            self.SSB[ii].promote(self.estim_level)
-
-
-# class RiaritSsbg
-#########################################################
-
+    def load_npz(self, path_RT):
+        data = np.load(path_RT)
+        for key, val in json.loads(str(data["definition"])).items():
+            setattr(self, key, val)
+        self.offsets = data["offsets"]
+        self.impact_table = data["impact_table"]
+        self.requir_table = data["requir_table"]
+        self.deacti_table = data["deacti_table"]
+
+    def save_npz(self, path_RT):
+        definition = {key: getattr(self, key) for key in self.definition}
+        np.savez(path_RT,
+                 definition=json.dumps(definition),
+                 offsets=self.offsets,
+                 impact_table=self.impact_table,
+                 requir_table=self.requir_table,
+                 deacti_table=self.deacti_table)
+
+# class RiaritTable
 #########################################################
-#########################################################
-# class RiaritSsb
 
-class RiaritSsb(SSbandit):
 
-    def __init__(self, id, nval, nKC, requer, stop, is_hierarchical=0, param_values=[], params={}):
-        # params :
+def load_table(RT):
+    # Compiled .npz, .json or .txt table of the RT, read once per process
+    path_RT = os.path.join(RT["path"], RT["file_name"])
+    for extension in [".npz", ".json", ".txt"]:
+        table = func.load_file_cached(path_RT + extension, RiaritTable)
+        if table is not None:
+            return table
+    raise IOError("No RiARiT table {}".format(path_RT))
 
-        SSbandit.__init__(self, id, nval, is_hierarchical, param_values, params=params)
-        #self.name = "rssb"
-        self.requer = requer
-        self.stop = stop
-        init_level = [0.0] * nKC
-        self.promote(init_level, True)
 
-    def promote(self, lvl, init=False):
-        for ii in range(self.nval):
-            if(np.array(lvl) >= np.array(self.requer[ii])).all() and (np.array(lvl) <= np.array(self.stop[ii])).any():
-                if(self.bandval[ii] == 0):
-                    if init == True:
-                        self.bandval[ii] = self.uniformval
-                    else:
-                        self.bandval[ii] = max(self.bandval)
-
-            if(np.array(lvl) > np.array(self.stop[ii])).all():
-                if(self.bandval[ii] != 0):
-                    self.bandval[ii] = 0
+def save_table(RT):
+    # Compiled .npz of the .json or .txt table of the RT
+    path_RT = os.path.join(RT["path"], RT["file_name"])
+    for extension in [".json", ".txt"]:
+        if os.path.exists(path_RT + extension):
+            RiaritTable(path_RT + extension).save_npz(path_RT + ".npz")
+            return path_RT + ".npz"
+    raise IOError("No RiARiT table {}".format(path_RT))
 
-        return
 
-# class RiaritSsb
-#########################################################
+def read_error_table(path):
+    error_ID_tab = []
+    error_tab = []
+    with open(path, 'rb') as reader:
+        lines = reader.readlines()
+    for lin in lines[2:]:
+        tmp = func.spe_split('\s(\d*\.\d*|\d+)|\s([a-zA-Z0-9_]*)', lin)
+        error_ID_tab.append(tmp[1])
+        error_tab.append([float(x) for x in tmp[2:len(tmp)]])
+    return error_ID_tab, error_tab
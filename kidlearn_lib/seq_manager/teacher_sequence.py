@@ -32,6 +32,14 @@ class Sequence(RiaritHssbg):
         self.toLvlYp = params['toLvlYp']
         self.minAns = params['minAns'] 
 
+    def shared_data(self):
+        return RiaritHssbg.shared_data(self) + [self.acts]
+
+    def fresh_state(self):
+        seq = RiaritHssbg.fresh_state(self)
+        seq.reinit([0] * len(self.answers), [0] * len(self.acts), 0, 0, 0)
+        return seq
+
     def getSeqLevel(self):
         return self.seqLevels
 
@@ -99,7 +107,7 @@ class Sequence(RiaritHssbg):
         return act
 
     def generate_acts(self, params=None, params_file="expe_seq", directory="sequence_def"):
-        params = params or func.load_json(params_file,directory)
+        params = params or func.load_json(params_file,directory,cached=True)
         self.acts = []
         #seq_dict = collections.OrderedDict(params["activity"])
         #for key,act_groups  in params["activity"].items():
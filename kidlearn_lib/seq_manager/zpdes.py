@@ -16,6 +16,13 @@ from .riarit import RiaritHssbg, RiaritSsbg, RiaritSsb
 from .hssbg import HierarchicalSSBG, SSBanditGroup, SSbandit
 from .. import functions as func
 
+
+def mean_rate(rates):
+    # np.mean of a success rate or of a short list of success rates
+    if isinstance(rates, list):
+        return sum(rates) / float(len(rates))
+    return rates
+
 #########################################################
 #########################################################
 # class ZpdesHssbg
@@ -26,7 +33,7 @@ class ZpdesHssbg(HierarchicalSSBG):
     def __init__(self, params=None, params_file="seq_test_1", directory="params_files"):
         # params : RT, path
 
-        params = params or func.load_json(params_file, directory)
+        params = params or func.load_json(params_file, directory, cached=True)
         HierarchicalSSBG.__init__(self, params=params)
         self.current_lvl_ex = {}
         if "riarit" in params.keys():
@@ -38,6 +45,12 @@ class ZpdesHssbg(HierarchicalSSBG):
 
         return
 
+    def shared_data(self):
+        shared = HierarchicalSSBG.shared_data(self)
+        if self.riarit is not None:
+            shared += self.riarit.shared_data()
+        return shared
+
     def compute_act_lvl(self, act, RT=None, **kwargs):
         if self.riarit is not None:
             return self.riarit.compute_act_lvl(act, RT)
@@ -62,7 +75,8 @@ class ZpdesHssbg(HierarchicalSSBG):
         if "act_prime" in graph_infos.keys():
             graph_def = graph_infos
         else:
-            graph_def = func.load_json(graph_infos["file_name"], graph_infos["path"])
+            # current_ssbg is set in the copy, not in the cached definition
+            graph_def = dict(func.load_json_cached(graph_infos["file_name"], graph_infos["path"]))
 
         self.ncompetencies = graph_def["ncompetencies"]
         graph_def["current_ssbg"] = graph_def["act_prime"]
@@ -149,6 +163,9 @@ class ZpdesSsbg(SSBanditGroup):
 
         self.CreateSSBs()
 
+    def shared_data(self):
+        return SSBanditGroup.shared_data(self) + [self.init_ssb]
+
     def instanciate_ssb(self, ii, is_hierarchical):
         params = self.params["ZpdesSsb"]
         params["init_ssb"] = self.init_ssb[ii]
@@ -187,6 +204,13 @@ class ZpdesSsbg(SSBanditGroup):
 
 class ZpdesSsb(SSbandit):
 
+    """\
+        Bandit values are stored in a float array. Only the last stepUpdate
+        answers of each value are read, they are kept in a ring buffer with
+        the running sums of the answers so that a success rate is the
+        difference of two running sums.
+    """
+
     def __init__(self, id, nval, is_hierarchical=0, param_values=None, params=None):
         # params :
         if param_values is None:
@@ -194,10 +218,11 @@ class ZpdesSsb(SSbandit):
         if params is None:
             params = {}
 
-        SSbandit.__init__(self, id, nval, is_hierarchical, param_values, params=params)
-        #self.name = "zssb"
         self.stepUpdate = params['stepUpdate']
         self.stepMax = self.stepUpdate / 2
+        SSbandit.__init__(self, id, nval, is_hierarchical, param_values, params=params)
+        #self.name = "zssb"
+        self.bandval = np.zeros(nval)
 
         func.setattr_dic_or_default(self, "size_window", params, 3)
         func.setattr_dic_or_default(self, "init_ssb", params, [0])
@@ -214,6 +239,70 @@ class ZpdesSsb(SSbandit):
 
         self.promote(True)
 
+    ###########################################################################
+    # Success history
+
+    @property
+    def success(self):
+        # Read only copy of the stored answers, they are added by add_success
+        return tuple(tuple(self.success_slice(x).tolist()) for x in range(self.nval))
+
+    @success.setter
+    def success(self, tabSuccess):
+        self.setSuccess(tabSuccess)
+
+    def getSuccess(self):
+        return self.success
+
+    def setSuccess(self, tabSuccess):
+        size = max(self.stepUpdate, 1)
+        self._success = np.zeros((self.nval, size))
+        self._nb_success = np.zeros(self.nval, dtype=int)
+        # _cum_success[val, n % (size + 1)] : sum of the n first answers
+        self._cum_success = np.zeros((self.nval, size + 1))
+        for val, suc in enumerate(tabSuccess):
+            for ans in suc:
+                self.add_success(val, ans)
+
+    def setBanditValue(self, banditTab):
+        self.bandval = np.array(banditTab, dtype=float)
+
+    def add_success(self, val, ans):
+        nb_success = self._nb_success[val]
+        size = self._success.shape[1]
+        self._success[val, nb_success % size] = ans
+        self._cum_success[val, (nb_success + 1) % (size + 1)] = self._cum_success[val, nb_success % (size + 1)] + ans
+        self._nb_success[val] = nb_success + 1
+
+    def nb_success(self, val, first_step=0, last_step=None):
+        # len(success[val][first_step:last_step])
+        return len(xrange(*slice(first_step, last_step).indices(self._nb_success[val])))
+
+    def success_slice(self, val, first_step=0, last_step=None):
+        # success[val][first_step:last_step], cut to the answers still stored
+        nb_success = self._nb_success[val]
+        start, stop, step = slice(first_step, last_step).indices(nb_success)
+        start = max(start, nb_success - self._success.shape[1])
+        return self._success[val, np.arange(start, stop) % self._success.shape[1]]
+
+    def success_mean(self, val, first_step=0, last_step=None):
+        # np.mean(success[val][first_step:last_step])
+        nb_success = self._nb_success[val]
+        start, stop, step = slice(first_step, last_step).indices(nb_success)
+        if start > 0 or stop < nb_success:
+            start = max(start, nb_success - self._success.shape[1])
+        if stop <= start:
+            return np.nan
+        size = self._cum_success.shape[1]
+        if start == 0:
+            sum_start = 0
+        else:
+            sum_start = self._cum_success[val, start % size]
+        return (self._cum_success[val, stop % size] - sum_start) / (stop - start)
+
+    # Success history
+    ###########################################################################
+
     def hierarchical_promote(self):
         for i in range(1, self.nval):
             if(self.bandval[i] == 0):
@@ -226,7 +315,7 @@ class ZpdesSsb(SSbandit):
                 for ssb in ssbg.SSB:
                     if ssb.is_hierarchical == 1:
                         for suc in ssb.success:
-                            if suc == []:
+                            if len(suc) == 0:
                                 sucToTreat = [0]
                             else:
                                 sucToTreat = suc
@@ -247,58 +336,58 @@ class ZpdesSsb(SSbandit):
         for i in range(1, self.nval):
             ssbgi1 = self.sonSSBG[self.param_values[i - 1]]
             tabTabSucessRatei1 = self.hsuccess_rate(ssbgi1, -self.stepMax)
-            tabMeanSucessRatei1 = [np.mean(tab) for tab in tabTabSucessRatei1]
-            meanSucessi1 = np.mean(tabMeanSucessRatei1)
+            tabMeanSucessRatei1 = [mean_rate(tab) for tab in tabTabSucessRatei1]
+            meanSucessi1 = mean_rate(tabMeanSucessRatei1)
 
             ssbgi = self.sonSSBG[self.param_values[i]]
             tabTabSucessRatei = self.hsuccess_rate(ssbgi, -self.stepUpdate)
             minTabTabSucessRatei = min([min(tab) for tab in tabTabSucessRatei])
 
-            if self.bandval[i] == 0 and self.len_success()[i] == 0 and meanSucessi1 > self.thresHProm:
+            if self.bandval[i] == 0 and self._nb_success[i] == 0 and meanSucessi1 > self.thresHProm:
                 self.bandval[i] = self.bandval[i - 1] * self.h_promote_coeff
-            elif self.bandval[i] != 0 and minTabTabSucessRatei > self.thresHDeact and self.bandval.count(0) < len(self.bandval) - 1:
+            elif self.bandval[i] != 0 and minTabTabSucessRatei > self.thresHDeact and self.nb_not_active() < self.nval - 1:
                 self.bandval[i] = 0
 
     def spe_promote_async(self):
+        active = self.active_bandits()
         succrate_active = self.success_rate(-self.stepMax,
-                                            val=self.active_bandits(),
+                                            val=active,
                                             min_nb_ans=2)
 
-        if succrate_active > self.upZPDval and 0 in self.len_success():  # and imax not in self.use_to_active: # and first < len(self.bandval) - 3:
-            self.bandval[self.len_success().index(0)] = min([self.bandval[x] for x in self.active_bandits()]) * self.promote_coeff
+        not_used = np.flatnonzero(self._nb_success == 0)
+        if succrate_active > self.upZPDval and len(not_used) > 0:  # and imax not in self.use_to_active: # and first < len(self.bandval) - 3:
+            self.bandval[not_used[0]] = self.bandval[active].min() * self.promote_coeff
 
-        max_usable_val_to_deact = [self.success_rate(-self.stepUpdate, val=[x]) for x in self.active_bandits() if self.len_success()[x] >= self.stepUpdate]
+        # The argmax of the usable values is read in all the active values
+        active = self.active_bandits()
+        max_usable_val_to_deact = [self.success_rate(-self.stepUpdate, val=[x]) for x in active if self._nb_success[x] >= self.stepUpdate]
 
         if len(max_usable_val_to_deact) > 0:
-            imaxd = self.active_bandits()[np.argmax(max_usable_val_to_deact)]
+            imaxd = active[np.argmax(max_usable_val_to_deact)]
             max_succrate_active_todeact = self.success_rate(-self.stepUpdate, val=[imaxd])
 
-            if max_succrate_active_todeact > self.deactZPDval and self.bandval.count(0) < len(self.bandval) - 1:  # imaxd != self.nval-1:
+            if max_succrate_active_todeact > self.deactZPDval and self.nb_not_active() < self.nval - 1:  # imaxd != self.nval-1:
                 # if self.bandval.count(0) < len(self.bandval)-1:
                 self.bandval[imaxd] = 0
 
     def spe_promote_windows(self):
         # Promote initialisation for beginning of the sequence with less than windows size bandit activated
-        if self.nval - self.len_success().count(0) < self.size_window:
-            i = self.len_success().index(0)
-            if self.success_rate(-self.stepMax, val=[i - 1]) > self.upZPDval and len(self.success[i - 1]) > 1:
+        not_used = np.flatnonzero(self._nb_success == 0)
+        if self.nval - len(not_used) < self.size_window:
+            i = not_used[0]
+            if self.success_rate(-self.stepMax, val=[i - 1]) > self.upZPDval and self._nb_success[i - 1] > 1:
                 self.bandval[i] = self.bandval[i - 1]
         else:
-            first = -1
-            for ii in range(self.nval):
-                if self.bandval[ii] != 0:
-                    first = ii
-                    break
-            for ii in range(self.nval):
-                if self.bandval[ii] != 0:
-                    last = ii
+            active = self.active_bandits()
+            first = active[0] if len(active) > 0 else -1
+            last = active[-1]
 
             valToUp = self.deactZPDval
             if first >= len(self.bandval) - 3:
                 valToUp = self.deactZPDval
 
-            if len(self.success[first][-self.stepMax:]) > 0:
-                if np.mean(self.success[first][-self.stepMax:]) > valToUp and len(self.success[last]) >= self.stepMax and first != last:
+            if self.nb_success(first, -self.stepMax) > 0:
+                if self.success_mean(first, -self.stepMax) > valToUp and self._nb_success[last] >= self.stepMax and first != last:
                     self.bandval[first] = 0
 
                     if first + 3 < len(self.bandval):
@@ -324,13 +413,16 @@ class ZpdesSsb(SSbandit):
                     self.spe_promote_windows()
 
     def active_bandits(self):
-        return [x for x in range(self.nval) if self.bandval[x] != 0]
+        return list(np.flatnonzero(self.bandval))
 
     def not_active_bandits(self):
-        return [x for x in range(self.nval) if self.bandval[x] == 0]
+        return list(np.flatnonzero(self.bandval == 0))
+
+    def nb_not_active(self):
+        return self.nval - np.count_nonzero(self.bandval)
 
     def len_success(self, first_val=0, last_val=None):
-        return [len(x) for x in self.success][first_val:last_val]
+        return self._nb_success.tolist()[first_val:last_val]
 
     def hsuccess_rate(self, ssbg, first_step=0, last_step=None, val=None, min_nb_ans=2, meanAll=0):
         successUsed = [ssb.success_rate(first_step, last_step, min_nb_ans=min_nb_ans, meanAll=meanAll) for ssb in ssbg.SSB if ssb.is_hierarchical == 1]
@@ -344,27 +436,27 @@ class ZpdesSsb(SSbandit):
             return 0
         succrate = []
         for x in val:
-            if len(self.success[x][first_step:last_step]) < min_nb_ans:
+            if self.nb_success(x, first_step, last_step) < min_nb_ans:
                 succrate.append(0)
             else:
-                succrate.append(np.mean(self.success[x][int(first_step):last_step]))
+                succrate.append(self.success_mean(x, int(first_step), last_step))
         #succrate = [np.mean(x[first_step:last_step]) for x in self.success][first_val:last_val]
         if len(succrate) > 1 and meanAll == 1:
-            return np.mean(succrate)
+            return mean_rate(succrate)
         elif len(succrate) > 1:
             return succrate
         else:
             return succrate[0]
 
     def calcul_reward_ssb(self, val, coeff_ans):
-        self.success[val].append(coeff_ans)
+        self.add_success(val, coeff_ans)
         # if len(self.sonSSBG.keys())> 0:
         #    print self.success
-        if len(self.success[val]) > 2:
-            y_step = min(self.stepUpdate, len(self.success[val]))
+        if self._nb_success[val] > 2:
+            y_step = min(self.stepUpdate, self._nb_success[val])
             y_range = y_step / 2
-            sum_old = np.mean(self.success[val][-y_step:-y_range])
-            sum_range = np.mean(self.success[val][-y_range:])
+            sum_old = self.success_mean(val, -y_step, -y_range)
+            sum_range = self.success_mean(val, -y_range)
             r = max(0, sum_range - sum_old)
         else:
             r = self.bandval[val]
@@ -3,6 +3,9 @@ from .p_student import Pstudent
 from .q_student import Qstudent
 from .kt_student import KTstudent
 from .population import Population
+from .kt_population_array import KTPopulationArray
+from .q_population_array import QPopulationArray
+from .uniform_table import UniformTable
 
 stud_dict_gen = {}
 stud_dict_gen["Qstudent"] = Qstudent
@@ -0,0 +1,180 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        KTPopulationArray
+# Purpose:     KT students population stored in arrays
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+
+#-------------------------------------------------------------------------------
+import numpy as np
+
+from .kt_student import KTstudent
+from .. import functions as func
+
+
+################################################################################
+# Class KT population array
+################################################################################
+
+class KTPopulationArray(object):
+
+    """\
+        N KT students stored as (N, K) parameters and levels arrays and
+        (N, K, K) kc_trans_dep. Transition and emission are computed for all
+        the students at once with the same probabilities as KTstudent.
+    """
+
+    # UniformTable of each student in paired simulations, None : draws of
+    # func.rng()
+    uniforms = None
+
+    # Random stream of each student, as the session of the student
+    random_states = None
+
+    def __init__(self, params=None, nb_students=1, params_file=None, directory="params_files", *args, **kwargs):
+        if params is None:
+            params = func.load_json(params_file, directory)
+        if isinstance(params, dict):
+            params = [params] * nb_students
+
+        self.params = params[0]
+        self._KC = list(self.params["knowledge_names"])
+        self.nb_students = len(params)
+
+        # Same bounds as KTstudent
+        self.p_L0 = self._kt_array(params, "L0")
+        self.p_T = self._kt_array(params, "T")
+        self.p_G = self._kt_array(params, "G")
+        self.p_S = self._kt_array(params, "S")
+        self.kc_trans_dep = np.array([p["kc_trans_dep"] for p in params], dtype=float)
+
+        self._level = np.array([p["knowledge_levels"] for p in params], dtype=float)
+        self.init_levels()
+
+    @staticmethod
+    def _kt_array(params, key):
+        return np.maximum(np.array([p["KT"][key] for p in params], dtype=float), 0)
+
+    @classmethod
+    def from_students(cls, students):
+        # Read parameters and current levels of KTstudent objects
+        pop = cls.__new__(cls)
+        pop.params = students[0].params
+        pop._KC = list(students[0].KC_names)
+        pop.nb_students = len(students)
+        pop.p_L0 = np.array([[kc.p_L0 for kc in stud._knowledges] for stud in students], dtype=float)
+        pop.p_T = np.array([[kc.p_T[0] for kc in stud._knowledges] for stud in students], dtype=float)
+        pop.p_G = np.array([[kc.p_G for kc in stud._knowledges] for stud in students], dtype=float)
+        pop.p_S = np.array([[kc.p_S for kc in stud._knowledges] for stud in students], dtype=float)
+        pop.kc_trans_dep = np.array([stud.kc_trans_dep for stud in students], dtype=float)
+        pop._level = np.array([stud.get_kc_lvl() for stud in students], dtype=float)
+        if all(stud.uniforms is not None for stud in students):
+            pop.uniforms = [stud.uniforms for stud in students]
+        return pop
+
+    @classmethod
+    def from_arrays(cls, params, KT, kc_trans_dep):
+        # (N, K) KT parameters and (N, K, K) kc_trans_dep, the other values
+        # are read in the KTstudent params
+        pop = cls.__new__(cls)
+        pop.params = params
+        pop._KC = list(params["knowledge_names"])
+        pop.nb_students = len(kc_trans_dep)
+        pop.p_L0 = np.maximum(KT["L0"], 0)
+        pop.p_T = np.maximum(KT["T"], 0)
+        pop.p_G = np.maximum(KT["G"], 0)
+        pop.p_S = np.maximum(KT["S"], 0)
+        pop.kc_trans_dep = np.asarray(kc_trans_dep, dtype=float)
+        pop._level = np.tile(np.array(params["knowledge_levels"], dtype=float), (pop.nb_students, 1))
+        pop.init_levels()
+        return pop
+
+    def __len__(self):
+        return self.nb_students
+
+    @property
+    def KC_names(self):
+        return self._KC
+
+    @property
+    def levels(self):
+        return self._level
+
+    def get_kc_lvl(self):
+        return self._level.copy()
+
+    def get_knowledge_idx(self, name, *arg, **kwargs):
+        return self._KC.index(name)
+
+    def init_levels(self):
+        # Same as KTKnowledge initialisation : KC learned with prob L0
+        learn = func.rng().random_sample(self._level.shape) < self.p_L0
+        self._level[learn] = 1
+
+    def student(self, num_stud):
+        # KTstudent object with the parameters and levels of one student
+        params = {"model": "KTstudent",
+                  "knowledge_names": list(self._KC),
+                  "knowledge_levels": [0] * len(self._KC),
+                  "kc_trans_dep": self.kc_trans_dep[num_stud].tolist(),
+                  "KT": {"L0": [0] * len(self._KC),
+                         "T": self.p_T[num_stud].tolist(),
+                         "G": self.p_G[num_stud].tolist(),
+                         "S": self.p_S[num_stud].tolist()}}
+        stud = KTstudent(params=params)
+        for kc, p_L0, level in zip(stud._knowledges, self.p_L0[num_stud], self._level[num_stud]):
+            kc.p_L0 = p_L0
+            kc._level = level
+        if self.uniforms is not None:
+            stud.set_uniforms(self.uniforms[num_stud])
+        return stud
+
+    def learn(self, ex_lvls):
+        # KC worked are updated one after the other as in KTstudent.learn
+        worked = np.asarray(ex_lvls) > 0
+        for k in np.nonzero(worked.any(axis=0))[0]:
+            to_learn = worked[:, k] & (self._level[:, k] != 1)
+            depend_prob = np.einsum("ij,ij->i", self._level, self.kc_trans_dep[:, k, :])
+            prob = depend_prob + self.p_T[:, k]
+            # KTstudent reads its UniformTable for each KC worked, but draws
+            # only for the KC not learned yet
+            u = self.draw(worked[:, k] if self.uniforms is not None else to_learn, k)
+            learn = to_learn & (u < prob)
+            self._level[learn, k] = 1
+
+    def emission_prob(self, ex_lvls):
+        worked = np.asarray(ex_lvls) > 0
+        prob_kc = np.where(self._level == 1, 1 - self.p_S, self.p_G)
+        nb_worked = worked.sum(axis=1)
+        prob_sum = (prob_kc * worked).sum(axis=1)
+        return np.where(nb_worked > 0, prob_sum / np.maximum(nb_worked, 1), 0)
+
+    def draw(self, rows, k):
+        # Uniforms of value k : the next ones of the UniformTable of the
+        # students of rows in paired simulations, of their random stream
+        # when they have one, else one for every student
+        if self.uniforms is None and self.random_states is None:
+            return func.rng().random_sample(self.nb_students)
+        u = np.ones(self.nb_students)
+        for num_stud in np.flatnonzero(rows):
+            if self.uniforms is not None:
+                u[num_stud] = self.uniforms[num_stud].next_value(k)
+            else:
+                u[num_stud] = self.random_states[num_stud].random_sample()
+        return u
+
+    def answer(self, ex_lvls, acts=None):
+
+        # Transition computation
+        self.learn(ex_lvls)
+
+        # Emission probablity
+        p_correct = self.emission_prob(ex_lvls)
+
+        # Answer / Observation
+        u = self.draw(np.ones(self.nb_students, dtype=bool), -1)
+        return (u < p_correct).astype(np.int8)
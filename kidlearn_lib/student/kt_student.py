@@ -24,6 +24,8 @@ from .. import functions as func
 
 class KTstudent(Student):
 
+    paired_draws = True
+
     def __init__(self, params=None, params_file="kt_stud", directory="params_files", *args, **kwargs):
         params = params or func.load_json(params_file, directory)
 
@@ -50,6 +52,19 @@ class KTstudent(Student):
             str += kc.__repr__() + ", "
         return str
 
+    def shared_data(self):
+        shared = Student.shared_data(self) + [self.kc_trans_dep]
+        for kc in self._knowledges:
+            shared += [kc.params, kc.p_T]
+        return shared
+
+    def fresh_state(self):
+        # Initial levels drawn again with p_L0, as in KTKnowledge
+        stud = Student.fresh_state(self)
+        for kc in stud._knowledges:
+            kc.update_state(kc.p_L0)
+        return stud
+
     @property
     def KC_names(self):
         return self.params["knowledge_names"]
@@ -62,22 +77,21 @@ class KTstudent(Student):
         return self._knowledges[idx]
 
     def learn(self, exercise):
-        for kc in exercise._knowledges:
-            if kc.level > 0:
+        for name, level in zip(exercise.knowledge_names, exercise.knowledge_levels):
+            if level > 0:
+                idx = self.get_knowledge_idx(name)
                 kc_levels = np.array(self.get_kc_lvl())
-                depend_val = self.kc_trans_dep[self.get_knowledge_idx(kc.name), :]
+                depend_val = self.kc_trans_dep[idx, :]
                 depend_prob = np.dot(kc_levels, depend_val)
-                self.get_knowledge(kc.name).update_state(adding_prob=depend_prob)
+                u = None if self.uniforms is None else self.uniforms.next_value(idx)
+                self._knowledges[idx].update_state(adding_prob=depend_prob, u=u)
 
     def emission_prob(self, exercise):
         prob_correct = []
         # print "yolo"
-        for kc in exercise._knowledges:
-            # print kc
-            # print kc.level
-            if kc.level > 0:
-                # print self.get_knowledge(kc.name).emission_prob()
-                prob_correct.append(self.get_knowledge(kc.name).emission_prob())
+        for name, level in zip(exercise.knowledge_names, exercise.knowledge_levels):
+            if level > 0:
+                prob_correct.append(self.get_knowledge(name).emission_prob())
 
         return np.mean(prob_correct)
 
@@ -90,8 +104,7 @@ class KTstudent(Student):
         p_correct = self.emission_prob(exercise)
 
         # Answer / Observation
-        s = np.random.multinomial(1, [1 - p_correct, p_correct])
-        ans = np.nonzero(s == 1)[0][0]
+        ans = func.bernoulli(p_correct, None if self.uniforms is None else self.uniforms.next_value(-1))
 
         exercise._answer = ans
         exercise.add_attr(_nb_try=1)
@@ -65,8 +65,7 @@ class KTfstudent(Student):
         print "p_correct : %s " % p_correct
 
         # Answer / Observation
-        s = np.random.multinomial(1, [1 - p_correct, p_correct])
-        ans = np.nonzero(s == 1)[0][0]
+        ans = func.bernoulli(p_correct)
 
         # Transition computation
         self.update_mastery(exercise)
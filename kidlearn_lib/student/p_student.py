@@ -11,7 +11,7 @@
 #-------------------------------------------------------------------------------
 import numpy as np
 
-from .q_student import Qstudent
+from .q_student import Qstudent, prob_correct_answer
 from .. import functions as func
 
 class Pstudent(Qstudent):
@@ -41,24 +41,31 @@ class Pstudent(Qstudent):
 
     def learn(self,act,lvls_ex):
         
-        prob_tab = self.calcul_prob_learn(lvls_ex)
-        prob = 1
-
-        for x in prob_tab:
-            prob = prob*x
-        prob = pow(prob,1.0/len(prob_tab))
+        prob = prob_correct_answer(self.calcul_prob_learn(lvls_ex))
         prob = prob*self.p_lvl_up_prob
 
-        for key,actspe in act.items():
-            for i in range(len(actspe)):
-                s = np.random.multinomial(1,[1-prob,prob]) 
-                do_lvl_up = np.nonzero(s==1)[0][0]
-                if do_lvl_up :
-                    lvl_up = self.p_learning[i] * (1-self.p_lvl[key][i][actspe[i]])  
-                    self.p_lvl[key][i][actspe[i]] = min(self.p_lvl[key][i][actspe[i]] + lvl_up,1)
-                
+        # One draw per act value, in the order of the act keys
+        values = [(key,i,actspe[i]) for key,actspe in act.items() for i in range(len(actspe))]
+        if self.uniforms is None:
+            u = func.rng().random_sample(len(values))
+        else:
+            u = np.array([self.uniforms.next_value(self.p_param_idx(key,i)) for key,i,val in values])
+        lvl_up = u < prob
+        for (key,i,val),up in zip(values,lvl_up):
+            if up :
+                p_lvl = self.p_lvl[key][i]
+                p_lvl[val] = min(p_lvl[val] + self.p_learning[i] * (1-p_lvl[val]),1)
+
         return
 
+    def nb_uniforms(self):
+        # Values of the skills, then of the act parameters, then the answers
+        return len(self._knowledges) + sum(len(p_lvl) for p_lvl in self.p_lvl.values()) + 1
+
+    def p_param_idx(self,key,i):
+        keys = sorted(self.p_lvl.keys())
+        return len(self._knowledges) + sum(len(self.p_lvl[k]) for k in keys[:keys.index(key)]) + i
+
     def compute_prob_correct_answer(self,act):
 
         nb_param = len(act)
@@ -69,12 +76,7 @@ class Pstudent(Qstudent):
             for i in range(0,len(actspe)) :
                 prob_tab.append(self.p_lvl[key][i][actspe[i]])
         #weight = [1,1,1,1]
-        prob = 1
-        #print prob_tab
-        for x in prob_tab:
-            prob = prob*x
-
-        prob = pow(prob,1.0/nb_param)
+        prob = pow(np.prod(prob_tab),1.0/nb_param)
         return prob
 
 
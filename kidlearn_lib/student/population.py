@@ -15,6 +15,7 @@ import uuid
 import copy
 
 from .kt_student import KTstudent
+from .kt_population_array import KTPopulationArray
 from .. import functions as func
 
 
@@ -36,7 +37,9 @@ class Population(object):
                 params.append(func.load_json(params_file, directory))
 
         if stud_list is not None:
-            self.students = stud_list
+            self.params = None
+            self._students = stud_list
+            self._all_students = True
 
         else:
             self.params = params
@@ -44,37 +47,83 @@ class Population(object):
             self.base_model = [x["base_model"] for x in params]
             self.disrupted_models = [x["disrupted_model"] for x in params]
             self.nb_students = [x["nb_students"] for x in params]
-            self.students_models = []
-            self.students = []
+
+            # (N, ...) parameter arrays of the students of each population,
+            # the KTstudent objects are created when they are asked for
+            self.models_arrays = []
             for nPop in range(len(self.params)):
                 self.perturb_KT_model(nPop)
+            self._students = [None] * sum(self.nb_students)
+            self._all_students = False
+
+    def __len__(self):
+        return len(self._students)
 
     def perturb_KT_model(self, nPop):
+        # One draw of the N students by row of kc_trans_dep and by KT
+        # parameter, negative KT perturbations are replaced by 0.01
+        base_model = self.base_model[nPop]
+        nb_students = self.nb_students[nPop]
+
         trans_dep_mv = self.disrupted_models[nPop]["kc_trans_dep"]
-        trans_dep_pert = []
-        for i in range(len(self.base_model[nPop]["kc_trans_dep"])):
-            mean = trans_dep_mv["mean"][i]
-            cov = np.diag(trans_dep_mv["var"][i])
-            trans_dep_pert.append(np.array(np.random.multivariate_normal(mean, cov, self.nb_students[nPop])))
+        trans_dep_pert = np.stack([func.rng().multivariate_normal(trans_dep_mv["mean"][i], np.diag(trans_dep_mv["var"][i]), nb_students)
+                                   for i in range(len(base_model["kc_trans_dep"]))], axis=1)
+        kc_trans_dep = np.clip(np.array(base_model["kc_trans_dep"], dtype=float) - trans_dep_pert, 0, None)
 
         kt_mv = self.disrupted_models[nPop]["KT"]
-        kt_pert = {}
-        for key in self.base_model[nPop]["KT"].keys():
-            mean = kt_mv["mean"][key]
-            cov = np.diag(kt_mv["var"][key])
-            kt_pert[key] = np.array(np.random.multivariate_normal(mean, cov, self.nb_students[nPop]))
-            for i in range(len(kt_pert[key])):
-                for j in range(len(kt_pert[key][i])):
-                    if kt_pert[key][i][j] < 0:
-                        kt_pert[key][i][j] = 0.01
-
-        for i in range(self.nb_students[nPop]):
-            new_model = copy.deepcopy(self.base_model[nPop])
-            for x in range(len(trans_dep_pert)):
-                new_model["kc_trans_dep"][x] = np.array(new_model["kc_trans_dep"][x]) - trans_dep_pert[x][i]
-                new_model["kc_trans_dep"][x] = [max(new_model["kc_trans_dep"][x][y], 0) for y in range(len(new_model["kc_trans_dep"][x]))]
-
-            for key in self.base_model[nPop]["KT"].keys():
-                new_model["KT"][key] = np.array(new_model["KT"][key]) - kt_pert[key][i]
-            self.students_models.append(new_model)
-            self.students.append(KTstudent(params=new_model))
+        kt = {}
+        for key in base_model["KT"].keys():
+            kt_pert = func.rng().multivariate_normal(kt_mv["mean"][key], np.diag(kt_mv["var"][key]), nb_students)
+            kt[key] = np.array(base_model["KT"][key], dtype=float) - np.where(kt_pert < 0, 0.01, kt_pert)
+
+        self.models_arrays.append({"kc_trans_dep": kc_trans_dep, "KT": kt})
+
+    def student_index(self, num_stud):
+        # Population and index in this population of a student
+        for nPop, nb_students in enumerate(self.nb_students):
+            if num_stud < nb_students:
+                return nPop, num_stud
+            num_stud -= nb_students
+        raise IndexError("No student {} in the population".format(num_stud))
+
+    def student_model(self, num_stud):
+        # KTstudent params of a student
+        nPop, i = self.student_index(num_stud)
+        model = copy.deepcopy(self.base_model[nPop])
+        model["kc_trans_dep"] = self.models_arrays[nPop]["kc_trans_dep"][i].tolist()
+        for key, val in self.models_arrays[nPop]["KT"].items():
+            model["KT"][key] = val[i].copy()
+        return model
+
+    @property
+    def students_models(self):
+        return [self.student_model(k) for k in range(len(self))]
+
+    def student(self, num_stud):
+        if self._students[num_stud] is None:
+            self._students[num_stud] = KTstudent(params=self.student_model(num_stud))
+        return self._students[num_stud]
+
+    @property
+    def students(self):
+        if not self._all_students:
+            for k in range(len(self._students)):
+                self.student(k)
+            self._all_students = True
+        return self._students
+
+    @students.setter
+    def students(self, stud_list):
+        self._students = stud_list
+        self._all_students = True
+
+    def to_array(self):
+        # Batched version of the population for BatchSimulation, read from
+        # the parameter arrays when no KTstudent was created
+        if self.params is None or any(stud is not None for stud in self._students):
+            return KTPopulationArray.from_students(self.students)
+
+        KT = {key: np.concatenate([arrays["KT"][key] for arrays in self.models_arrays])
+              for key in self.models_arrays[0]["KT"].keys()}
+        kc_trans_dep = np.concatenate([arrays["kc_trans_dep"] for arrays in self.models_arrays])
+        return KTPopulationArray.from_arrays(self.base_model[0], KT, kc_trans_dep)
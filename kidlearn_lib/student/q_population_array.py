@@ -0,0 +1,135 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        QPopulationArray
+# Purpose:     Q students population stored in arrays
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+
+#-------------------------------------------------------------------------------
+import numpy as np
+
+from .q_student import Qstudent, prob_learn, level_up, prob_answer_per_skill, prob_correct_answer
+from .. import functions as func
+
+
+################################################################################
+# Class Q population array
+################################################################################
+
+class QPopulationArray(object):
+
+    """\
+        N Q students stored as (N, K) levels and learning_progress arrays,
+        the logistic values and the other parameters are (N, 1) columns.
+        Learning and answers of all the students are computed at once with
+        the model functions of q_student.
+    """
+
+    # UniformTable of each student in paired simulations, random stream of
+    # each student as its session
+    uniforms = None
+    random_states = None
+
+    def __init__(self, params=None, nb_students=1, params_file=None, directory="params_files", *args, **kwargs):
+        if params is None:
+            params = func.load_json(params_file, directory)
+        if isinstance(params, dict):
+            params = [params] * nb_students
+
+        students = [Qstudent(params=p) for p in params]
+        self.__dict__.update(QPopulationArray.from_students(students).__dict__)
+
+    @classmethod
+    def from_students(cls, students):
+        # Read parameters and current levels of Qstudent objects
+        pop = cls.__new__(cls)
+        pop.params = students[0].params
+        pop._KC = list(students[0].KC_names)
+        pop.nb_students = len(students)
+        nb_kc = len(pop._KC)
+
+        pop._level = np.array([stud.get_kc_lvl() for stud in students], dtype=float)
+        pop.learning_progress = np.array([stud.learning_progress[:nb_kc] for stud in students], dtype=float)
+        pop.log_vals = {key: [cls._column([stud.log_vals[key][i] for stud in students]) for i in range(2)]
+                        for key in ["learn", "ans"]}
+        pop.guess_prob = cls._column([stud.guess_prob for stud in students])
+        pop.min_prob = cls._column([stud.min_prob for stud in students])
+        pop.threshold_prob = np.array([stud.threshold_prob for stud in students], dtype=float)
+        if all(stud.uniforms is not None for stud in students):
+            pop.uniforms = [stud.uniforms for stud in students]
+        return pop
+
+    @staticmethod
+    def _column(values):
+        return np.array(values, dtype=float)[:, np.newaxis]
+
+    def __len__(self):
+        return self.nb_students
+
+    @property
+    def KC_names(self):
+        return self._KC
+
+    @property
+    def levels(self):
+        return self._level
+
+    def get_kc_lvl(self):
+        return self._level.copy()
+
+    def get_knowledge_idx(self, name, *arg, **kwargs):
+        return self._KC.index(name)
+
+    def student(self, num_stud):
+        # Qstudent object with the parameters and levels of one student
+        stud = Qstudent(params=dict(self.params, knowledge_levels=self._level[num_stud].tolist()))
+        stud.log_vals = {key: [float(val[num_stud]) for val in vals] for key, vals in self.log_vals.items()}
+        stud.learning_progress = self.learning_progress[num_stud].tolist()
+        stud.guess_prob = float(self.guess_prob[num_stud])
+        stud.min_prob = float(self.min_prob[num_stud])
+        stud.threshold_prob = float(self.threshold_prob[num_stud])
+        if self.uniforms is not None:
+            stud.set_uniforms(self.uniforms[num_stud])
+        return stud
+
+    def learn(self, ex_lvls, prob=1):
+        # Same draws as Qstudent.learn : one per skill of each student
+        ex_lvls = np.asarray(ex_lvls, dtype=float)
+        prob_learn_tab = prob_learn(self._level, ex_lvls, self.log_vals["learn"], prob, self.min_prob)
+        lvl_up = self.draw_learn(ex_lvls) < prob_learn_tab
+        lvl_up &= self._level < ex_lvls
+        new_levels = level_up(self._level, ex_lvls, self.learning_progress)
+        self._level = np.where(lvl_up, new_levels, self._level)
+
+    def draw_learn(self, ex_lvls):
+        # (N, K) uniforms : K draws of the stream of each student as in
+        # Qstudent.learn, in paired simulations the value of skill k is read
+        # in the UniformTable of the students working it
+        if self.uniforms is not None:
+            u = np.ones(self._level.shape)
+            worked = np.broadcast_to(ex_lvls > 0, self._level.shape)
+            for num_stud, k in zip(*np.nonzero(worked)):
+                u[num_stud, k] = self.uniforms[num_stud].next_value(k)
+            return u
+        if self.random_states is not None:
+            return np.array([random_state.random_sample(self._level.shape[1]) for random_state in self.random_states])
+        return func.rng().random_sample(self._level.shape)
+
+    def draw_answer(self):
+        if self.uniforms is None:
+            return func.random_sample_rows(np.arange(self.nb_students), self.random_states)
+        return np.array([uniforms.next_value(-1) for uniforms in self.uniforms])
+
+    def compute_prob_correct_answer(self, ex_lvls):
+        prob_tab = prob_answer_per_skill(self._level, ex_lvls, self.log_vals, self.guess_prob)
+        return prob_correct_answer(prob_tab, self.threshold_prob)
+
+    def answer(self, ex_lvls, acts=None):
+        # Exercises of a batch simulation have one try, as in StudentList
+        self.learn(ex_lvls)
+        p_correct = self.compute_prob_correct_answer(ex_lvls)
+        return (self.draw_answer() < p_correct).astype(np.int8)
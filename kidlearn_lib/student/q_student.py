@@ -18,6 +18,8 @@ from .. import functions as func
 
 class Qstudent(Student):
 
+    paired_draws = True
+
     def __init__(self, params = None, params_file = "qstud_test_1", directory = "params_files", *args, **kwargs):
         params = params or func.load_json(params_file,directory)
 
@@ -41,6 +43,9 @@ class Qstudent(Student):
         #self.lvl_up_prob = 0.8 #0.6
         #student_state["skills"] = self._skills
 
+    def shared_data(self):
+        return Student.shared_data(self) + [self.log_vals, self.learning_progress]
+
     @property
     def knowledges(self):
         return self._knowledges
@@ -52,65 +57,37 @@ class Qstudent(Student):
         return student_state
 
 
+    # Computed for all the skills at once with the model functions below
+
     def calcul_prob_learn(self,lvls_ex,prob = 1):
-        probas = []
-        #distTot = [self._knowledges[i]._level - lvls_ex[i] for i in range(len(lvls_ex))]
-        #distTot = sum(distTot)/len(lvls_ex)
-        #coeffDist = 1 - min(max(0,distTot),1)
-
-        for i in range(len(lvls_ex)):
-            #p = self.lvl_up_prob*(1-(lvls_ex[i] - self._knowledges[i]._level)*self.coeff_lvl_up)
-            if lvls_ex[i] - self._knowledges[i]._level  > 0.4:
-                p = 0
-            else:
-                p = (1.0/(1+1*np.exp(self.log_vals["learn"][0]*(self._knowledges[i]._level - lvls_ex[i]+self.log_vals["learn"][1]))))
-            
-            p  = p * prob
-            p = min(1,max(self.min_prob,p))
-            probas.append(p)
-
-        return probas
+        return prob_learn(self.get_kc_lvl(),lvls_ex,self.log_vals["learn"],prob,self.min_prob)
 
     def learn(self,lvls_ex,prob = 1):
+        lvls_ex = np.asarray(lvls_ex,dtype = float)
+        levels = self.get_kc_lvl()
         prob_learn_tab = self.calcul_prob_learn(lvls_ex,prob)
-        for i in range(0,len(lvls_ex)):
-            s = np.random.multinomial(1,[1-prob_learn_tab[i],prob_learn_tab[i]]) 
-            lvl_up = np.nonzero(s==1)[0][0]
-            if lvl_up and self._knowledges[i]._level < lvls_ex[i]:
-                coef_up = max(0.00,self.learning_progress[i] * (lvls_ex[i]-self._knowledges[i]._level))
-                newlvl = min(self._knowledges[i]._level + coef_up,lvls_ex[i])
-                if i > 3:
-                    if newlvl <= self._knowledges[i-3]:
-                        self._knowledges[i]._level = newlvl
-                else:
-                    self._knowledges[i]._level = newlvl
+        lvl_up = self.draw_learn(lvls_ex) < prob_learn_tab
+        new_levels = level_up(levels,lvls_ex,self.learning_progress[:len(lvls_ex)])
+        for i in np.flatnonzero(lvl_up & (levels < lvls_ex)):
+            self._knowledges[i]._level = new_levels[i]
         return
 
-    def calcul_prob_answer_per_skill(self,lvls_ex):
-        probas = []
-        for i in range(0,len(lvls_ex)):
-            if lvls_ex[i] - self._knowledges[i]._level  > 0.6:
-                p = 0
-            else:
-            #p = self.guess_prob*((1.0/pi)*arctan((self._knowledges[i]._level - lvls_ex[i] + 0.1)*30) + 0.5)
-                p = self.guess_prob*(1.0/(1+1*np.exp(self.log_vals["ans"][0]*(self._knowledges[i]._level - lvls_ex[i]+self.log_vals["learn"][1]))))
-            probas.append(p)
+    def draw_learn(self,lvls_ex):
+        # One uniform per skill, in paired simulations the value of skill i
+        # is read when the exercise works it, as in KTstudent
+        if self.uniforms is None:
+            return func.rng().random_sample(len(lvls_ex))
+        u = np.ones(len(lvls_ex))
+        for i in np.flatnonzero(lvls_ex > 0):
+            u[i] = self.uniforms.next_value(i)
+        return u
 
-        return probas
+    def calcul_prob_answer_per_skill(self,lvls_ex):
+        return prob_answer_per_skill(self.get_kc_lvl(),lvls_ex,self.log_vals,self.guess_prob)
 
     def compute_prob_correct_answer(self,lvls):
-        nb_skills = len(lvls)
         prob_tab = self.calcul_prob_answer_per_skill(lvls)
-        #weight = [1,1,1,1,1,1]
-        prob = 1
-        for x in prob_tab:
-            prob = prob*x
-        prob = pow(prob,1.0/nb_skills)
-        
-        if prob < self.threshold_prob :
-            prob = 0
-        
-        return prob
+        return prob_correct_answer(prob_tab,self.threshold_prob)
 
     def answer(self,exercise, nb_try = 0):#act,lvls):
         self.learn(exercise.get_knowledges_level())
@@ -120,4 +97,35 @@ class Qstudent(Student):
         #cor = np.nonzero(s==1)[0][0]
         return self.try_and_answer(prob_correct,exercise)
 
+# Q student model on arrays : the last axis is the skill axis, the levels of
+# a population are (N, K) arrays and its parameters (N,) or (N, 1) arrays (see
+# QPopulationArray)
+
+def logistic(x,log_vals):
+    return 1.0/(1+1*np.exp(log_vals[0]*x))
+
+def prob_learn(levels,lvls_ex,log_vals,prob = 1,min_prob = 0):
+    diff = levels - np.asarray(lvls_ex,dtype = float)
+    p = np.where(-diff > 0.4,0,logistic(diff+log_vals[1],log_vals))
+    p = p * prob
+    return np.minimum(1,np.maximum(min_prob,p))
+
+def level_up(levels,lvls_ex,learning_progress):
+    # Levels after a level up of every skill, the caller keeps the levels of
+    # the skills which are not learned or already above lvls_ex
+    lvls_ex = np.asarray(lvls_ex,dtype = float)
+    coef_up = np.maximum(0.00,np.asarray(learning_progress) * (lvls_ex-levels))
+    return np.minimum(levels + coef_up,lvls_ex)
+
+def prob_answer_per_skill(levels,lvls_ex,log_vals,guess_prob = 1):
+    # "learn" shift of the logistic, as in the original model
+    diff = levels - np.asarray(lvls_ex,dtype = float)
+    p = guess_prob*logistic(diff+log_vals["learn"][1],log_vals["ans"])
+    return np.where(-diff > 0.6,0,p)
+
+def prob_correct_answer(prob_tab,threshold_prob = 0):
+    prob_tab = np.asarray(prob_tab)
+    prob = np.power(np.prod(prob_tab,axis = -1),1.0/prob_tab.shape[-1])
+    return prob * (prob >= threshold_prob)
+
 
@@ -47,6 +47,39 @@ class Student(object):
     def get_kc_lvl(self):
         return np.array([kc._level for kc in self._knowledges])
 
+    # Clones share the params of the student, the knowledges are copied. A
+    # clone is a new student with its own uuid
+    def shared_data(self):
+        return [self.params]
+
+    def clone(self):
+        stud = func.clone(self, self.shared_data())
+        stud.uuid = str(uuid.uuid1())
+        return stud
+
+    # Paired simulations : the learning and answer draws of the models with
+    # paired_draws are read in a UniformTable, None : draws of func.rng()
+    paired_draws = False
+    uniforms = None
+
+    def set_uniforms(self, uniforms):
+        if not self.paired_draws:
+            raise ValueError("paired simulations need students drawing from a UniformTable, "
+                             "{} students draw their own random numbers".format(type(self).__name__))
+        self.uniforms = uniforms
+
+    def nb_uniforms(self):
+        # One value per KC and the last one for the answers
+        return len(self.KC_names) + 1
+
+    def fresh_state(self):
+        # Clone with the knowledge levels of the params
+        stud = self.clone()
+        if self.params is not None and "knowledge_levels" in self.params:
+            for kc, level in zip(stud._knowledges, self.params["knowledge_levels"]):
+                kc._level = level
+        return stud
+
     def get_state(self, seq_values=None):
         student_state = {}
         student_state["id"] = self._id
@@ -63,8 +96,7 @@ class Student(object):
         nb_try = 0
         ans = 0
         while ans == 0 and nb_try < exercise.nbMax_try:
-            s = np.random.multinomial(1,[1-prob_correct,prob_correct])
-            ans = np.nonzero(s==1)[0][0]
+            ans = func.bernoulli(prob_correct, None if self.uniforms is None else self.uniforms.next_value(-1))
             if ans == 0:
                 nb_try += 1
 
@@ -0,0 +1,46 @@
+#-*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        uniform_table
+# Purpose:     Random numbers of a student fixed by step, for paired simulations
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+################################################################################
+# Class UniformTable
+################################################################################
+
+
+class UniformTable(object):
+
+    """\
+        Uniforms of the learning and answer draws of one student. Value k < K
+        is read each time KC k is worked, the last value at each answer : the
+        n-th learning opportunity of a KC and the n-th answer get the same
+        number whatever the exercises chosen. Students with the same seed
+        compare the sequence managers with common random numbers. The values
+        are drawn by blocks of block_size.
+    """
+
+    def __init__(self, seed, nb_values, block_size=100):
+        self.random_state = np.random.RandomState(seed)
+        self.block_size = block_size
+        self._table = np.zeros((0, nb_values))
+        self.nb_read = np.zeros(nb_values, dtype=int)
+
+    def next_value(self, k):
+        n = self.nb_read[k]
+        if n >= len(self._table):
+            block = self.random_state.random_sample((self.block_size, self._table.shape[1]))
+            self._table = np.vstack([self._table, block])
+        self.nb_read[k] += 1
+        return self._table[n, k]
+
+# Class UniformTable
+################################################################################
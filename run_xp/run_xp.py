@@ -153,7 +153,7 @@ def gen_xp_to_optimize(zpdes_confs, ref_xp="optimize", nb_stud=1000, nb_step=100
         zpdes = k_lib.seq_manager.ZpdesHssbg(params=conf)
         wss = []
         for k in range(nb_stud):
-            wss.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(zpdes)))
+            wss.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=zpdes.clone()))
         wkgs["zpdes_{}".format(ref)] = [k_lib.experimentation.WorkingGroup(WorkingSessions=wss)]
 
     xp = k_lib.experimentation.Experiment(WorkingGroups=wkgs,
@@ -210,12 +210,13 @@ def gen_stud_confs(nb_students=1000, perturbated=0, params_file="stud_KT6kc_0"):
     return stud_confs
 
 
-def xp_conf_to_job(zpdes_conf, stud_confs, nb_step=100, studFile=""):
+def xp_conf_to_job(zpdes_conf, stud_confs, nb_step=100, studFile="", record="cost_only"):
     xp_conf = {}
     xp_conf["zpdes_conf"] = zpdes_conf
     xp_conf["stud_confs"] = stud_confs
     xp_conf["nb_steps"] = nb_step
     xp_conf["stud_file"] = studFile
+    xp_conf["record"] = record
 
     return xp_conf
 
@@ -298,7 +299,7 @@ def perturbated_population(zpdes_confs, ref_xp="perturbation", nb_step=100, base
         zpdes = k_lib.seq_manager.ZpdesHssbg(params=conf)
         wss = []
         for k in range(nb_stud):
-            wss.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(population.students[k])), seq_manager=copy.deepcopy(zpdes))
+            wss.append(k_lib.experimentation.WorkingSession(student=population.students[k].clone()), seq_manager=zpdes.clone())
         wkgs["zpdes_{}".format(ref)] = [k_lib.experimentation.WorkingGroup(WorkingSessions=wss)]
 
     xp = k_lib.experimentation.Experiment(WorkingGroups=wkgs,
@@ -341,13 +342,14 @@ def calcul_cost_zpdes(zpdes_param, nb_stud=100, nb_step=100):
 
     stud = k_lib.student.KTstudent(params_file="stud_KT6kc", directory="params_files/studModel")
     zpdes = k_lib.seq_manager.ZpdesHssbg(params=params)
-    ws_tab_zpdes = []
-    for i in range(nb_stud):
-        ws_tab_zpdes.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(zpdes)))
-    wG_zpdes = k_lib.experimentation.WorkingGroup(WorkingSessions=ws_tab_zpdes)
-    wG_zpdes.run(nb_step)
-    print np.mean(wG_zpdes.calcul_cost())
-    return np.mean(wG_zpdes.calcul_cost())
+
+    # All the students start from the same student and ZPDES states
+    students = k_lib.student.KTPopulationArray.from_students([stud] * nb_stud)
+    zpdes_batch = k_lib.seq_manager.BatchedZpdesHssbg(template=zpdes, nb_students=nb_stud)
+    simulation = k_lib.experimentation.BatchSimulation(students, zpdes_batch, nb_step)
+    simulation.run(nb_step)
+    print np.mean(simulation.calcul_cost())
+    return np.mean(simulation.calcul_cost())
 
 
 # example of complete simulation
@@ -496,11 +498,11 @@ def kt_expe(ref_xp="KT6kc", path_to_save="experimentation/data/", nb_step=100, n
     for i in range(nb_stud):
         if disruption == 1:
             stud = population.students[i]
-        ws_tab_zpdes.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(zpdes)))
-        ws_tab_zpdesOpt.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(zpdesOpt)))
-        ws_tab_pomdp.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(pomdP)))
-        #ws_tab_riarit.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager = copy.deepcopy(riarit)))
-        ws_tab_random.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(random)))
+        ws_tab_zpdes.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=zpdes.clone()))
+        ws_tab_zpdesOpt.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=zpdesOpt.clone()))
+        ws_tab_pomdp.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=pomdP.clone()))
+        #ws_tab_riarit.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager = riarit.clone()))
+        ws_tab_random.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=random.clone()))
 
     wG_zpdes = k_lib.experimentation.WorkingGroup(WorkingSessions=ws_tab_zpdes)
     wG_zpdesOpt = k_lib.experimentation.WorkingGroup(WorkingSessions=ws_tab_zpdesOpt)
@@ -658,8 +660,8 @@ def multi_kt_xp(ref_xp="KT6kc", path_to_save="experimentation/data/", nb_step=10
             ws_tab_zpdes[ii].append(k_lib.experimentation.WorkingSession(student=cPickle.loads(cPickle.dumps(stud, -1)), seq_manager=cPickle.loads(cPickle.dumps(zpdesHs[ii], -1))))
             ws_tab_zpdesOpt[ii].append(k_lib.experimentation.WorkingSession(student=cPickle.loads(cPickle.dumps(stud, -1)), seq_manager=cPickle.loads(cPickle.dumps(zpdesOpts[ii], -1))))
             ws_tab_pomdp[ii].append(k_lib.experimentation.WorkingSession(student=cPickle.loads(cPickle.dumps(stud, -1)), seq_manager=cPickle.loads(cPickle.dumps(pomdPs[ii], -1))))
-        #ws_tab_riarit.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager = copy.deepcopy(riarit)))
-        #ws_tab_random.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(random)))
+        #ws_tab_riarit.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager = riarit.clone()))
+        #ws_tab_random.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=random.clone()))
 
     wG_zpdes = [k_lib.experimentation.WorkingGroup(WorkingSessions=x) for x in ws_tab_zpdes]
 
@@ -727,7 +729,7 @@ def expe_zpdes_promot(ref_xp="kt_multiZ", path_to_save="experimentation/data/",
         zpdes = k_lib.seq_manager.ZpdesHssbg(params=conf)
         wss = []
         for i in range(nb_stud):
-            wss.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(zpdes)))
+            wss.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=zpdes.clone()))
         wkgs["zpdes_{}".format(ref)] = [k_lib.experimentation.WorkingGroup(WorkingSessions=wss)]
 
     xp = k_lib.experimentation.Experiment(WorkingGroups=wkgs,
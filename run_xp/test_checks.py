@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Name:        test_checks
+# Purpose:     Checks of the batch simulation, of the POMDP precision modes
+#              and of the belief trackers
+#
+# Author:      Bclement
+#
+# Created:     14-03-2015
+# Copyright:   (c) BClement 2015
+# Licence:     GNU Affero General Public License v3.0
+
+# -------------------------------------------------------------------------------
+import os
+import sys
+import time
+import numpy as np
+
+# Parameter and graph files are read relative to run_xp
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, "..")
+
+import kidlearn_lib as k_lib
+from kidlearn_lib import functions as func
+from kidlearn_lib.experimentation import WorkingSession, WorkingGroup
+from kidlearn_lib.seq_manager.pomdp import POMDP
+from kidlearn_lib.seq_manager.belief_tracker import ExactBelief, belief_trackers
+
+
+def batch_check(student, seq_manager, nb_students=100, nb_ex=100, seed=0):
+    # Group of clones of student and seq_manager run session by session and
+    # in a batch simulation with the same seed : share of the students with
+    # the same KC levels at each step and max difference of their costs, 1
+    # and 0 when the batch simulation reproduces the sessions
+    groups = {}
+    for batched in [False, True]:
+        working_sessions = [WorkingSession(student=student.clone(), seq_manager=seq_manager.clone())
+                            for i in range(nb_students)]
+        groups[batched] = WorkingGroup(params={"seed": seed}, WorkingSessions=working_sessions)
+        groups[batched].run(nb_ex, batched=batched)
+
+    sessions = zip(groups[False].working_sessions, groups[True].working_sessions)
+    same_levels = [np.array_equal(np.asarray(ws.kc_level_all_time(), dtype=np.float32),
+                                  np.asarray(bs.kc_level_all_time(), dtype=np.float32)) for ws, bs in sessions]
+    cost_diff = np.abs(np.array(groups[False].calcul_cost()) - np.array(groups[True].calcul_cost()))
+    return {"same_levels": np.mean(same_levels),
+            "cost_error": np.max(cost_diff)}
+
+
+def precision_check(params, precisions=("float64", "float32"), reference="float128", nb_beliefs=2000, seed=0):
+    # Policies solved on the same beliefs with each precision compared to
+    # the reference one : max relative value error and fraction of beliefs
+    # with the same best action, on the sampled and on random beliefs
+    params = dict(params, policy_cache=0)
+    np.random.seed(seed)
+    D = POMDP(params=params).belief_sample
+
+    def solve(precision):
+        np.random.seed(seed)
+        return POMDP(params=dict(params, precision=precision), belief_sample=D)
+
+    ref = solve(reference)
+    B = np.vstack([D.toarray(), np.random.dirichlet(np.ones(ref._nS) * 0.2, nb_beliefs)])
+    Qref = np.array(ref.q_values(B), dtype=float)
+    Vref = Qref.max(axis=1)
+
+    results = {}
+    for precision in precisions:
+        pomdp = solve(precision)
+        Q = np.array(pomdp.q_values(B), dtype=float)
+        results[precision] = {"value_error": np.max(np.abs(Q.max(axis=1) - Vref)) / np.max(np.abs(Vref)),
+                              "same_action": np.mean(Q.argmax(axis=1) == Qref.argmax(axis=1))}
+    return results
+
+
+def compare_trackers(pomdp, tracker="factored", nb_students=1000, nb_steps=100, seed=0):
+    # Students simulated with the POMDP model, actions chosen with the exact
+    # belief : share of steps where the tracker gives the same best action,
+    # L1 distance of the beliefs and time of the updates
+    np.random.seed(seed)
+    exact = ExactBelief(pomdp)
+    other = belief_trackers[tracker](pomdp)
+
+    S = np.array([pomdp.initS() for x in range(nb_students)])
+    B = np.repeat(exact.initial()[np.newaxis], nb_students, axis=0)
+    M = np.repeat(other.initial()[np.newaxis], nb_students, axis=0)
+    same_action = []
+    distance = []
+    times = {"exact": 0, tracker: 0}
+    for t in range(nb_steps):
+        Q = pomdp.q_values(B)
+        Q_other = pomdp.q_values(other.belief(M))
+        same_action.append(np.mean(Q.argmax(axis=1) == Q_other.argmax(axis=1)))
+        distance.append(np.mean(np.abs(B - other.belief(M)).sum(axis=1)))
+
+        A = pomdp.sample_batch(B)
+        S, R, Z, Bnew = pomdp.step_batch(S, A, B)
+        for a in np.unique(A):
+            rows = np.flatnonzero(A == a)
+            t0 = time.time()
+            B[rows] = exact.update(B[rows], a, Z[rows])
+            t1 = time.time()
+            M[rows] = other.update(M[rows], a, Z[rows])
+            times["exact"] += t1 - t0
+            times[tracker] += time.time() - t1
+
+    return {"same_action": np.mean(same_action),
+            "distance": np.mean(distance),
+            "update_time": times}
+
+
+def pomdp_params(ref_pomdp="2"):
+    return func.load_json("POMDP_KT6kc_{}".format(ref_pomdp), "params_files/POMDP")
+
+
+def test_batch_check(nb_students=50, nb_ex=60, seed=1):
+    stud = k_lib.student.KTstudent(params_file="stud_KT6kc_2", directory="params_files/studModel")
+    params_random = func.load_json("RANDOM_KT6kc", "params_files/RANDOM")
+    params_random["graph"]["file_name"] = "graph_KT6kc_2"
+    params_random["graph"]["main_act"] = "KT6kc"
+    seq_managers = {
+        "ZPDES": k_lib.seq_manager.ZpdesHssbg(params=func.load_json("ZPDES_KT6kc", "params_files/ZPDES")),
+        "Random": k_lib.seq_manager.RandomSequence(params=params_random),
+        "RiARiT": k_lib.seq_manager.RiaritHssbg(params=func.load_json("RIARIT_KT6kc", "params_files/RIARIT")),
+        "POMDP": k_lib.seq_manager.POMDP(params=pomdp_params())
+    }
+    for name, seq_manager in sorted(seq_managers.items()):
+        result = batch_check(stud, seq_manager, nb_students, nb_ex, seed)
+        print name, result
+        assert result["same_levels"] == 1.0, name
+        assert result["cost_error"] == 0.0, name
+
+
+def test_precision_check():
+    results = precision_check(pomdp_params(), nb_beliefs=500)
+    print results
+    for precision, result in results.items():
+        assert result["value_error"] < 1e-4, precision
+        assert result["same_action"] > 0.99, precision
+
+
+def test_compare_trackers():
+    result = compare_trackers(POMDP(params=pomdp_params()), nb_students=200, nb_steps=50)
+    print result
+    # The factored tracker drops the correlations between KC : only a loose
+    # bound on its gap to the exact belief
+    assert result["distance"] < 0.25
+    assert result["same_action"] > 0.5
+
+
+if __name__ == "__main__":
+    test_batch_check()
+    test_precision_check()
+    test_compare_trackers()
@@ -68,7 +68,7 @@ def test_new_zpdes(ref_xp="KT6kc", path_to_save="experimentation/data/", nb_step
     zpdes = k_lib.seq_manager.ZpdesHssbg(params=params_zpdes)
     ws_tab_zpdes = []
     for i in range(100):
-        ws_tab_zpdes.append(k_lib.experimentation.WorkingSession(student=copy.deepcopy(stud), seq_manager=copy.deepcopy(zpdes)))
+        ws_tab_zpdes.append(k_lib.experimentation.WorkingSession(student=stud.clone(), seq_manager=zpdes.clone()))
 
     wG_zpdes = k_lib.experimentation.WorkingGroup(WorkingSessions=ws_tab_zpdes)
     wkgs = {